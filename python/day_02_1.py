@@ -14,58 +14,33 @@ while we haven't hit the 99 instruction (or run off the end of the tape):
     advance the appropriate number of cells
     (4 at the moment, but that will change in day 5)
 """
+import intcode
 import unittest
 
 
-class Intcode:
-    def __init__(self, raw_source):
-        self.raw_source = raw_source
-        self.tape = self._parse(raw_source)
-        self.pc = 0
-
+class Intcode(intcode.Intcode):
+    """
+    just ADD and MULTIPLY, with no parameter modes
     """
-    Execute the current instruction at pc
+    OPCODES = intcode.DAY_2
 
-    Returns either the next value of PC, or None when opcode 99 is reached
+    # day 2 called memory the tape, and ip the program counter (pc)
 
-    May also raise ValueError if the current instruction pointed
-    at by pc is invalid
-    """
-    def step(self):
-        current_instruction = self.tape[self.pc]
-        if current_instruction == 99:
-            return None
-        elif current_instruction == 1:
-            # handle ADD
-            addr_1, addr_2, save_addr = self.tape[self.pc + 1:self.pc + 4]
-            operand_1 = self.tape[addr_1]
-            operand_2 = self.tape[addr_2]
-
-            self.tape[save_addr] = operand_1 + operand_2
-
-            return self.pc + 4
-        elif current_instruction == 2:
-            # handle multiply
-            addr_1, addr_2, save_addr = self.tape[self.pc + 1:self.pc + 4]
-            operand_1 = self.tape[addr_1]
-            operand_2 = self.tape[addr_2]
-
-            self.tape[save_addr] = operand_1 * operand_2
-
-            return self.pc + 4
-        else:
-            raise ValueError(
-                f'Invalid opcode {current_instruction} at {self.pc}')
-
-    def run(self):
-        while True:
-            result = self.step()
-            if result is None:
-                break
-            self.pc = result
-
-    def _parse(self, raw):
-        return list(map(int, raw.split(",")))
+    @property
+    def tape(self):
+        return self.memory
+
+    @tape.setter
+    def tape(self, tape):
+        self.memory = tape
+
+    @property
+    def pc(self):
+        return self.ip
+
+    @pc.setter
+    def pc(self, pc):
+        self.ip = pc
 
 
 class Test(unittest.TestCase):
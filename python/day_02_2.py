@@ -15,59 +15,161 @@ while we haven't hit the 99 instruction (or run off the end of memory):
     advance ip
     (4 at the moment, but that will change in day 5)
 """
-import itertools
+import intcode
 import unittest
 
 
-class Intcode:
-    def __init__(self, raw_source):
-        self.raw_source = raw_source
-        self.memory = self._parse(raw_source)
-        self.ip = 0
+class Intcode(intcode.Intcode):
+    """
+    just ADD and MULTIPLY, with no parameter modes
+    """
+    OPCODES = intcode.DAY_2
 
+
+class Polynomial:
+    """
+    a polynomial in noun and verb, stored as
+    {(power of noun, power of verb): coefficient}
     """
-    Execute the current instruction at ip
 
-    Returns either the next value of ip, or None when opcode 99 is reached
+    def __init__(self, terms):
+        self.terms = {powers: c for powers, c in terms.items() if c != 0}
+
+    @classmethod
+    def of(cls, value):
+        if isinstance(value, Polynomial):
+            return value
+        return cls({(0, 0): value})
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for powers, coefficient in Polynomial.of(other).terms.items():
+            terms[powers] = terms.get(powers, 0) + coefficient
+        return Polynomial(terms)
+
+    __radd__ = __add__
+
+    def __mul__(self, other):
+        terms = {}
+        for (n1, v1), c1 in self.terms.items():
+            for (n2, v2), c2 in Polynomial.of(other).terms.items():
+                powers = (n1 + n2, v1 + v2)
+                terms[powers] = terms.get(powers, 0) + c1 * c2
+        return Polynomial(terms)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        return (isinstance(other, Polynomial)
+                and self.terms == other.terms)
+
+    def __repr__(self):
+        return f"Polynomial({self.terms})"
+
+    def in_verb(self, noun):
+        """
+        substitute noun, returning the coefficients of verb ** 0, 1, ...
+        """
+        coefficients = [0] * (max((v for _, v in self.terms), default=0) + 1)
+        for (n, v), coefficient in self.terms.items():
+            coefficients[v] += coefficient * noun ** n
+        return coefficients
+
+
+NOUN = Polynomial({(1, 0): 1})
+VERB = Polynomial({(0, 1): 1})
+# the value of a cell read through an address that depends on noun or verb
+UNKNOWN = object()
+
 
-    May also raise ValueError if the current instruction pointed
-    at by ip is invalid
+def symbolic_output(source):
     """
-    def step(self):
-        current_instruction = self.memory[self.ip]
-        if current_instruction == 99:
+    run the program with memory[1] and memory[2] set to NOUN and VERB and
+    return memory[0] as a Polynomial
+
+    reading through an address that depends on them gives UNKNOWN, which is
+    fine as long as it gets overwritten. returns None if an opcode or store
+    address depends on them, or memory[0] ends up UNKNOWN
+    """
+    memory = Intcode(source).memory
+    memory[1] = NOUN
+    memory[2] = VERB
+    ip = 0
+    while True:
+        try:
+            instruction = memory[ip]
+            addr_1, addr_2, save_addr = memory[ip + 1:ip + 4]
+        except (IndexError, ValueError):
+            return None
+        if not isinstance(instruction, int):
+            return None
+        elif instruction == 99:
+            break
+        elif instruction not in (1, 2) or not isinstance(save_addr, int):
             return None
-        elif current_instruction == 1:
-            # handle ADD
-            addr_1, addr_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1 = self.memory[addr_1]
-            param_2 = self.memory[addr_2]
 
-            self.memory[save_addr] = param_1 + param_2
+        params = [memory[addr] if isinstance(addr, int) else UNKNOWN
+                  for addr in (addr_1, addr_2)]
+        if any(param is UNKNOWN for param in params):
+            memory[save_addr] = UNKNOWN
+        elif instruction == 1:
+            memory[save_addr] = params[0] + params[1]
+        else:
+            memory[save_addr] = params[0] * params[1]
 
-            return self.ip + 4
-        elif current_instruction == 2:
-            # handle multiply
-            addr_1, addr_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1 = self.memory[addr_1]
-            param_2 = self.memory[addr_2]
+        ip += 4
 
-            self.memory[save_addr] = param_1 * param_2
+    if memory[0] is UNKNOWN:
+        return None
+    return Polynomial.of(memory[0])
 
-            return self.ip + 4
-        else:
-            raise ValueError(
-                f'Invalid opcode {current_instruction} at {self.ip}')
 
-    def run(self):
-        while True:
-            result = self.step()
-            if result is None:
-                break
-            self.ip = result
+def search(source, needed_output, limit=100):
+    """
+    brute force (noun, verb) with both in range(limit), or None
+    """
+    machine = Intcode(source)
+    for noun in range(limit):
+        for verb in range(limit):
+            machine.reset()
+            machine.memory[1] = noun
+            machine.memory[2] = verb
+
+            machine.run()
+
+            if machine.memory[0] == needed_output:
+                return noun, verb
+    return None
+
 
-    def _parse(self, raw):
-        return list(map(int, raw.split(",")))
+def solve(source, needed_output, limit=100):
+    """
+    same result as search, but solves symbolic_output for verb at each noun
+    instead of running the program, when the program allows it
+    """
+    polynomial = symbolic_output(source)
+    if polynomial is None:
+        return search(source, needed_output, limit)
+
+    for noun in range(limit):
+        coefficients = polynomial.in_verb(noun)
+        while len(coefficients) > 1 and coefficients[-1] == 0:
+            coefficients.pop()
+        if len(coefficients) == 1:
+            if coefficients[0] == needed_output:
+                return noun, 0
+        elif len(coefficients) == 2:
+            constant, slope = coefficients
+            verb, remainder = divmod(needed_output - constant, slope)
+            if remainder == 0 and 0 <= verb < limit:
+                return noun, verb
+        else:
+            for verb in range(limit):
+                value = sum(c * verb ** power
+                            for power, c in enumerate(coefficients))
+                if value == needed_output:
+                    return noun, verb
+    return None
 
 
 class Test(unittest.TestCase):
@@ -118,6 +220,26 @@ class Test(unittest.TestCase):
         machine.run()
         self.assertEqual([30, 1, 1, 4, 2, 5, 6, 0, 99], machine.memory)
 
+    def test_reset(self):
+        machine = Intcode(self.EXAMPLE)
+        machine.run()
+        machine.reset()
+        self.assertEqual(0, machine.ip)
+        self.assertEqual(
+            [1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50],
+            machine.memory)
+
+    def test_fork(self):
+        machine = Intcode(self.EXAMPLE)
+        machine.step()
+        fork = machine.fork()
+        self.assertIs(machine.image, fork.image)
+        self.assertEqual(0, fork.ip)
+        fork.run()
+        self.assertEqual(3500, fork.memory[0])
+        self.assertEqual(70, machine.memory[3])
+        self.assertEqual(1, machine.memory[0])
+
     def test_run_2(self):
         machine = Intcode(self.EXAMPLE)
         machine.run()
@@ -125,6 +247,36 @@ class Test(unittest.TestCase):
             [3500, 9, 10, 70, 2, 3, 11, 0, 99, 30, 40, 50],
             machine.memory)
 
+    # ------------------------------------ symbolic ---------------------------
+
+    PADDING = ",0" * 90
+
+    def test_polynomial(self):
+        self.assertEqual(
+            Polynomial({(1, 1): 3, (0, 0): 4}),
+            NOUN * VERB * 3 + 4)
+        self.assertEqual([4, 6], (NOUN * VERB * 3 + 4).in_verb(2))
+
+    def test_symbolic_output(self):
+        self.assertEqual(
+            NOUN + VERB,
+            symbolic_output("1,0,0,3,1,1,2,0,99" + self.PADDING))
+        self.assertEqual(
+            NOUN * VERB * 2,
+            symbolic_output("1,0,0,3,2,1,2,0,2,0,13,0,99,2" + self.PADDING))
+
+    def test_symbolic_output_through_symbolic_address(self):
+        self.assertIsNone(symbolic_output("1,0,0,0,99" + self.PADDING))
+        # the add at 8 stores through an address computed from noun
+        self.assertIsNone(
+            symbolic_output("1,0,0,3,1,1,98,11,1,0,0,0,99" + self.PADDING))
+
+    def test_solve(self):
+        source = "1,0,0,3,2,1,2,0,2,0,13,0,99,2" + self.PADDING
+        self.assertEqual((1, 42), solve(source, 84))
+        self.assertEqual(search(source, 84), solve(source, 84))
+        self.assertIsNone(solve(source, 83))
+
 
 if __name__ == "__main__":
     # unittest.main()
@@ -132,14 +284,5 @@ if __name__ == "__main__":
         source = f.read()
 
     needed_output = 19690720
-    for noun in itertools.count():  # from 0 to infinity
-        for verb in range(0, noun + 1):
-            machine = Intcode(source)
-            machine.memory[1] = noun
-            machine.memory[2] = verb
-
-            machine.run()
-
-            if machine.memory[0] == needed_output:
-                print(f"found {noun * 100 + verb}: {noun=} {verb=}")
-                exit()
+    noun, verb = solve(source, needed_output)
+    print(f"found {noun * 100 + verb}: {noun=} {verb=}")
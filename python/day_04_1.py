@@ -1,5 +1,9 @@
+import itertools
+import math
 import unittest
 
+import helpers
+
 
 def valid(code):
     return has_double(code) and no_decrease(code)
@@ -29,6 +33,37 @@ def pairwise(list):
     return [(list[i], list[i+1]) for i in range(len(list) - 1)]
 
 
+def _step(state, digit):
+    last, double = state
+    if last is not None and digit < last:
+        return None
+    return (digit, double or digit == last)
+
+
+# state is (last digit, seen a double yet)
+RULES = helpers.Automaton(
+    initial=(None, False),
+    step=_step,
+    accepts=lambda state: state[1],
+)
+
+
+def count_valid(start, end):
+    """
+    how many codes in [start, end] are valid, without checking each one
+    """
+    return helpers.count_accepted(RULES, start, end)
+
+
+def valid_codes(start, end):
+    """
+    the valid codes in [start, end], in order. only codes that never
+    decrease are generated, so there's just a double to check
+    """
+    return (code for code in helpers.non_decreasing(start, end)
+            if has_double(code))
+
+
 class Test(unittest.TestCase):
     def test_test(self):
         self.assertEqual([1, 2, 3, 4], digits(1234))
@@ -50,14 +85,44 @@ class Test(unittest.TestCase):
         self.assertEqual(False, valid(223450))
         self.assertEqual(False, valid(123789))
 
+    def test_valid_codes(self):
+        for start, end in ((0, 3000), (271973, 290000), (99990, 100100)):
+            self.assertEqual(
+                [code for code in range(start, end + 1) if valid(code)],
+                list(valid_codes(start, end)))
+
+    def test_non_decreasing(self):
+        for start, end in ((-5, 3000), (271973, 290000), (99990, 100100),
+                           (1, 1), (10, 10), (0, 0)):
+            self.assertEqual(
+                [code for code in range(start, end + 1)
+                 if code >= 0 and no_decrease(code)],
+                list(helpers.non_decreasing(start, end)))
+
+    def test_non_decreasing_starts_late(self):
+        codes = helpers.non_decreasing(888888888888888887, 10 ** 19)
+        self.assertEqual(
+            [888888888888888888, 888888888888888889, 888888888888888899],
+            list(itertools.islice(codes, 3)))
+        self.assertEqual(
+            [1111111111111111111],
+            list(helpers.non_decreasing(10 ** 18, 1111111111111111111)))
+
+    def test_count_valid(self):
+        for start, end in ((1, 3000), (271973, 290000), (99990, 100100)):
+            self.assertEqual(
+                sum(1 for code in range(start, end + 1) if valid(code)),
+                count_valid(start, end))
+
+    def test_count_valid_huge(self):
+        # non-decreasing codes of each length, less the strictly increasing
+        expected = sum(math.comb(length + 8, 8) - math.comb(9, length)
+                       for length in range(1, 19))
+        self.assertEqual(expected, count_valid(1, 10 ** 18))
+
 
 if __name__ == "__main__":
     start = 271973
     end = 785961
-    found = 0
-
-    for code in range(start, end + 1):
-        if valid(code):
-            found += 1
 
-    print(found)
\ No newline at end of file
+    print(count_valid(start, end))
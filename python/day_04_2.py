@@ -1,5 +1,8 @@
+import math
 import unittest
 
+import helpers
+
 
 def valid(code):
     return has_double(code) and no_decrease(code)
@@ -30,6 +33,40 @@ def pairwise(list):
     return [(list[i], list[i+1]) for i in range(len(list) - 1)]
 
 
+def _step(state, digit):
+    last, run, pair = state
+    if last is not None and digit < last:
+        return None
+    if digit == last:
+        return (digit, min(run + 1, 3), pair)
+    return (digit, 1, pair or run == 2)
+
+
+# state is (last digit, length of the run of it so far, capped at 3, seen a
+# run of exactly two yet)
+RULES = helpers.Automaton(
+    initial=(None, 0, False),
+    step=_step,
+    accepts=lambda state: state[2] or state[1] == 2,
+)
+
+
+def count_valid(start, end):
+    """
+    how many codes in [start, end] are valid, without checking each one
+    """
+    return helpers.count_accepted(RULES, start, end)
+
+
+def valid_codes(start, end):
+    """
+    the valid codes in [start, end], in order. only codes that never
+    decrease are generated, so there's just a run of exactly two to check
+    """
+    return (code for code in helpers.non_decreasing(start, end)
+            if has_double(code))
+
+
 class Test(unittest.TestCase):
     def test_test(self):
         self.assertEqual([1, 2, 3, 4], digits(1234))
@@ -51,14 +88,44 @@ class Test(unittest.TestCase):
         self.assertEqual(False, valid(123444))
         self.assertEqual(True, valid(111122))
 
+    def test_valid_codes(self):
+        for start, end in ((0, 3000), (271973, 290000), (99990, 100100)):
+            self.assertEqual(
+                [code for code in range(start, end + 1) if valid(code)],
+                list(valid_codes(start, end)))
+
+    def test_count_valid(self):
+        for start, end in ((1, 3000), (271973, 290000), (99990, 100100)):
+            self.assertEqual(
+                sum(1 for code in range(start, end + 1) if valid(code)),
+                count_valid(start, end))
+
+    def test_count_valid_huge(self):
+        # a code that never decreases has no zeros and is just how many of
+        # each of 1-9 it has, and it's valid if one of those counts is 2.
+        # inclusion-exclusion over the k digits that have exactly two
+        def multisets(kinds, size):
+            if size < 0:
+                return 0
+            if not kinds:
+                return 1 if size == 0 else 0
+            return math.comb(size + kinds - 1, kinds - 1)
+
+        def exactly_two(length):
+            return sum((-1) ** (k + 1) * math.comb(9, k)
+                       * multisets(9 - k, length - 2 * k)
+                       for k in range(1, 10))
+
+        for power in range(1, 19):
+            self.assertEqual(
+                sum(exactly_two(length) for length in range(1, power + 1)),
+                count_valid(1, 10 ** power))
+        # counted by brute force
+        self.assertEqual(3243, count_valid(1, 10 ** 6))
+
 
 if __name__ == "__main__":
     start = 271973
     end = 785961
-    found = 0
-
-    for code in range(start, end + 1):
-        if valid(code):
-            found += 1
 
-    print(found)
+    print(count_valid(start, end))
@@ -15,119 +15,15 @@ while we haven't hit the 99 instruction (or run off the end of memory):
     advance ip
     (4 at the moment, but that will change in day 5)
 """
-import helpers
+import intcode
 import unittest
 
 
-class Intcode:
-
-    # instructions
-    ADD = 1
-    MULTIPLY = 2
-    INPUT = 3
-    OUTPUT = 4
-    HALT = 99
-
-    # modes
-    POSITION = 0
-    IMMEDIATE = 1
-
-    def __init__(self, raw_source, inputs):
-        self.raw_source = raw_source
-        self.memory = self._parse(raw_source)
-        self.ip = 0
-        self.input = inputs
-        self.output = []
-
-    def step(self):
-        # import pdb; pdb.set_trace()
-        """
-        Execute the current instruction at ip
-
-        Returns either the next value of ip, or None when opcode 99 is reached
-
-        May also raise ValueError if the current instruction pointed
-        at by ip is invalid
-        """
-        current_instruction, modes = self.parse_instruction(
-            self.memory[self.ip])
-
-        if current_instruction == self.HALT:
-            return None
-        elif current_instruction == self.ADD:
-            param_1, param_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1_mode, param_2_mode, save_addr_mode = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            self.memory[save_addr] = param_1 + param_2
-
-            return self.ip + 4
-        elif current_instruction == self.MULTIPLY:
-            param_1, param_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1_mode, param_2_mode, save_addr_mode = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            self.memory[save_addr] = param_1 * param_2
-
-            return self.ip + 4
-        elif current_instruction == self.INPUT:
-            # handle input
-            addr = self.memory[self.ip + 1]
-            self.memory[addr] = self.input
-
-            return self.ip + 2
-        elif current_instruction == self.OUTPUT:
-            param = self.memory[self.ip + 1]
-            value = self.resolve(param, modes[0])
-            self.output.append(value)
-
-            return self.ip + 2
-        else:
-            raise ValueError(
-                f'Invalid opcode {current_instruction} at {self.ip}')
-
-    def resolve(self, position_or_immediate, mode):
-        if mode == Intcode.IMMEDIATE:
-            return position_or_immediate
-        elif mode == Intcode.POSITION:
-            return self.memory[position_or_immediate]
-        else:
-            raise ValueError(f"Invalid mode {mode}")
-
-    @staticmethod
-    def parse_instruction(instruction):
-        """
-        take a raw instruction (like 2, or 1002) and return an instruction and
-        list of modes
-        ie: 2 -> (2, [0, 0, 0])
-            1002 -> (2, [0, 1, 0])
-        """
-        if 0 < instruction < 100:
-            return (instruction, [Intcode.POSITION, Intcode.POSITION,
-                                  Intcode.POSITION])
-        modes = helpers.digits(instruction)
-
-        # combine rightmost 2 digits of instruction into new instruction
-        instruction = modes.pop() + (10 * modes.pop())
-
-        modes = list(reversed(modes))
-
-        while len(modes) < 3:
-            modes.append(Intcode.POSITION)
-
-        return (instruction, modes)
-
-    def run(self):
-        while True:
-            result = self.step()
-            if result is None:
-                break
-            self.ip = result
-
-    def _parse(self, raw):
-        return list(map(int, raw.split(",")))
+class Intcode(intcode.Intcode):
+    """
+    ADD and MULTIPLY from day 2, plus INPUT, OUTPUT and parameter modes
+    """
+    OPCODES = intcode.DAY_5_1
 
 
 class Test(unittest.TestCase):
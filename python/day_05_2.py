@@ -15,168 +15,25 @@ while we haven't hit the 99 instruction (or run off the end of memory):
     advance ip
     (4 at the moment, but that will change in day 5)
 """
-import helpers
+from array import array
+import collections
+import intcode
+import intcode_image
+import intcode_memo
+import intcode_memory
+import os
+import queue
+import tempfile
 import unittest
+from unittest import mock
 
 
-class Intcode:
-
-    # instructions
-    ADD = 1
-    MULTIPLY = 2
-    INPUT = 3
-    OUTPUT = 4
-    JUMP_IF_TRUE = 5
-    JUMP_IF_FALSE = 6
-    LESS_THAN = 7
-    EQUALS = 8
-    HALT = 99
-
-    # modes
-    POSITION = 0
-    IMMEDIATE = 1
-
-    def __init__(self, raw_source, inputs):
-        self.raw_source = raw_source
-        self.memory = self._parse(raw_source)
-        self.ip = 0
-        self.input = inputs
-        self.output = []
-
-    def step(self):
-        # import pdb; pdb.set_trace()
-        """
-        Execute the current instruction at ip
-
-        Returns either the next value of ip, or None when opcode 99 is reached
-
-        May also raise ValueError if the current instruction pointed
-        at by ip is invalid
-        """
-        current_instruction, modes = self.parse_instruction(
-            self.memory[self.ip])
-
-        if current_instruction == self.HALT:
-            return None
-        elif current_instruction == self.ADD:
-            param_1, param_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1_mode, param_2_mode, save_addr_mode = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            self.memory[save_addr] = param_1 + param_2
-
-            return self.ip + 4
-        elif current_instruction == self.MULTIPLY:
-            param_1, param_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1_mode, param_2_mode, save_addr_mode = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            self.memory[save_addr] = param_1 * param_2
-
-            return self.ip + 4
-        elif current_instruction == self.INPUT:
-            addr = self.memory[self.ip + 1]
-            self.memory[addr] = self.input
-
-            return self.ip + 2
-        elif current_instruction == self.OUTPUT:
-            param = self.memory[self.ip + 1]
-            value = self.resolve(param, modes[0])
-            self.output.append(value)
-
-            return self.ip + 2
-        elif current_instruction == self.JUMP_IF_TRUE:
-            param_1, param_2 = self.memory[self.ip + 1:self.ip + 3]
-            param_1_mode, param_2_mode, _ = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            if param_1 != 0:
-                return param_2
-            else:
-                return self.ip + 3
-        elif current_instruction == self.JUMP_IF_FALSE:
-            param_1, param_2 = self.memory[self.ip + 1:self.ip + 3]
-            param_1_mode, param_2_mode, _ = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            if param_1 == 0:
-                return param_2
-            else:
-                return self.ip + 3
-        elif current_instruction == self.LESS_THAN:
-            param_1, param_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1_mode, param_2_mode, save_addr_mode = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            if param_1 < param_2:
-                output = 1
-            else:
-                output = 0
-            self.memory[save_addr] = output
-
-            return self.ip + 4
-        elif current_instruction == self.EQUALS:
-            param_1, param_2, save_addr = self.memory[self.ip + 1:self.ip + 4]
-            param_1_mode, param_2_mode, save_addr_mode = modes
-            param_1 = self.resolve(param_1, param_1_mode)
-            param_2 = self.resolve(param_2, param_2_mode)
-
-            if param_1 == param_2:
-                output = 1
-            else:
-                output = 0
-            self.memory[save_addr] = output
-
-            return self.ip + 4
-        else:
-            raise ValueError(
-                f'Invalid opcode {current_instruction} at {self.ip}')
-
-    def resolve(self, position_or_immediate, mode):
-        if mode == Intcode.IMMEDIATE:
-            return position_or_immediate
-        elif mode == Intcode.POSITION:
-            return self.memory[position_or_immediate]
-        else:
-            raise ValueError(f"Invalid mode {mode}")
-
-    @staticmethod
-    def parse_instruction(instruction):
-        """
-        take a raw instruction (like 2, or 1002) and return an instruction and
-        list of modes
-        ie: 2 -> (2, [0, 0, 0])
-            1002 -> (2, [0, 1, 0])
-        """
-        if 0 < instruction < 100:
-            return (instruction, [Intcode.POSITION, Intcode.POSITION,
-                                  Intcode.POSITION])
-        modes = helpers.digits(instruction)
-
-        # combine rightmost 2 digits of instruction into new instruction
-        instruction = modes.pop() + (10 * modes.pop())
-
-        modes = list(reversed(modes))
-
-        while len(modes) < 3:
-            modes.append(Intcode.POSITION)
-
-        return (instruction, modes)
-
-    def run(self):
-        while True:
-            result = self.step()
-            if result is None:
-                break
-            self.ip = result
-
-    def _parse(self, raw):
-        return list(map(int, raw.split(",")))
+class Intcode(intcode.Intcode):
+    """
+    everything from day 5: ADD, MULTIPLY, INPUT, OUTPUT, the jumps and the
+    comparisons, with parameter modes
+    """
+    OPCODES = intcode.DAY_5_2
 
 
 class Test(unittest.TestCase):
@@ -226,6 +83,101 @@ class Test(unittest.TestCase):
         machine.run()
         self.assertEqual([42], machine.output)
 
+    def test_needs_input(self):
+        machine = Intcode("3,0,4,0,3,0,4,0,99")
+        self.assertEqual(Intcode.NEEDS_INPUT, machine.run())
+        self.assertEqual(0, machine.ip)
+
+        machine.feed(7)
+        self.assertEqual(Intcode.NEEDS_INPUT, machine.run())
+        self.assertEqual(4, machine.ip)
+        self.assertEqual([7], machine.output)
+
+        machine.feed(8)
+        self.assertEqual(Intcode.HALTED, machine.run())
+        self.assertEqual([7, 8], machine.output)
+
+    def test_input_iterable(self):
+        machine = Intcode("3,0,4,0,3,0,4,0,99", iter([1, 2]))
+        self.assertEqual(Intcode.HALTED, machine.run())
+        self.assertEqual([1, 2], machine.output)
+
+    def test_input_queue(self):
+        inputs = queue.Queue()
+        inputs.put(3)
+        machine = Intcode("3,0,4,0,3,0,4,0,99", inputs)
+        self.assertEqual(Intcode.NEEDS_INPUT, machine.run())
+        inputs.put(4)
+        self.assertEqual(Intcode.HALTED, machine.run())
+        self.assertEqual([3, 4], machine.output)
+
+    def test_input_deque(self):
+        queue = collections.deque([3])
+        machine = Intcode("3,0,4,0,3,0,4,0,99", queue)
+        machine.run()
+        queue.append(4)
+        machine.run()
+        self.assertEqual([3, 4], machine.output)
+
+    def test_outputs(self):
+        machine = Intcode("104,1,3,0,4,0,99", [2])
+        outputs = machine.outputs()
+        self.assertEqual(1, next(outputs))
+        self.assertEqual(2, machine.ip)
+        self.assertEqual([2], list(outputs))
+        self.assertEqual(Intcode.HALTED, machine.status)
+
+    def test_typed_memory(self):
+        machine = Intcode("1101,2,3,5,99,0", memory=intcode_memory.typed)
+        self.assertIsInstance(machine.memory, array)
+        machine.run()
+        self.assertEqual([1101, 2, 3, 5, 99, 5], list(machine.memory))
+
+    def test_typed_memory_overflow(self):
+        big = 2 ** 62
+        machine = Intcode(f"1102,{big},4,5,99,0", memory=intcode_memory.typed)
+        machine.run()
+        self.assertEqual([1102, big, 4, 5, 99, big * 4], machine.memory)
+
+        machine = Intcode("3,3,99,0", 2 ** 64, memory=intcode_memory.typed)
+        machine.run()
+        self.assertEqual([3, 3, 99, 2 ** 64], machine.memory)
+
+    def test_typed_memory_input_overflow(self):
+        for big in (2 ** 70, [2 ** 70, 1], iter([2 ** 70])):
+            machine = Intcode("3,5,4,5,99,0", big, memory=intcode_memory.typed)
+            self.assertEqual(Intcode.HALTED, machine.run_fast())
+            self.assertEqual([2 ** 70], machine.output)
+            self.assertEqual(2 ** 70, machine.memory[5])
+
+    def test_paged_memory(self):
+        machine = Intcode("1101,1,2,1000000,4,1000000,4,5000,99",
+                          memory=intcode_memory.Paged)
+        machine.run()
+        self.assertEqual([3, 0], machine.output)
+        self.assertEqual(2, len(machine.memory.pages))
+
+    def test_lazy_memory(self):
+        source = "1101,1,2,7,4,7,99,0" + ",0" * 5000
+        machine = Intcode(source, memory=intcode_memory.Lazy)
+        machine.run()
+        self.assertEqual([3], machine.output)
+        self.assertEqual(3, machine.memory[7])
+
+    def test_parsed_source(self):
+        machine = Intcode((1101, 2, 3, 5, 99, 0))
+        machine.run()
+        self.assertEqual([1101, 2, 3, 5, 99, 5], machine.memory)
+
+    def test_image_source(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.txt")
+            with open(path, "w") as f:
+                f.write("1101,100,-1,4,0\n")
+            machine = Intcode(intcode_image.load(path), 0)
+        machine.run()
+        self.assertEqual([1101, 100, -1, 4, 99], machine.memory)
+
     def test_parse_instruction_classic(self):
         self.assertEqual(
             (Intcode.ADD, [Intcode.POSITION,
@@ -240,6 +192,12 @@ class Test(unittest.TestCase):
             Intcode.parse_instruction(1002)
         )
 
+    def test_decode_is_cached(self):
+        machine = Intcode(self.EXAMPLE, 0)
+        self.assertEqual(Intcode.parse_instruction(1002), machine.decode(1002))
+        other = Intcode(self.EXAMPLE, 0)
+        self.assertIs(machine.decode(1002), other.decode(1002))
+
     # ------------------------------------ runs ---------------------------
 
     def test_run_simple_add(self):
@@ -335,13 +293,52 @@ class Test(unittest.TestCase):
         machine.run()
         self.assertEqual([1001], machine.output)
 
+    def test_run_rewrites_opcode(self):
+        # the ADD at 0 is turned into a MULTIPLY after its first run
+        machine = Intcode("1001,18,3,18,4,18,1101,1001,1,0,1007,18,20,19,"
+                          "1005,19,0,99,1,0")
+        machine.run()
+        self.assertEqual([4, 12, 36], machine.output)
+        self.assertEqual(1002, machine.memory[0])
+
+    def test_run_past_64_bits(self):
+        # output the input times 3, then whether the input was negative
+        program = "3,15,1002,15,3,16,4,16,1007,15,0,17,4,17,99,0,0,0"
+        for memory in (list, intcode_memory.typed):
+            machine = Intcode(program, 2 ** 70, memory=memory)
+            machine.run()
+            self.assertEqual([3 * 2 ** 70, 0], machine.output)
+
+            machine = Intcode(program, -2 ** 70, memory=memory)
+            machine.run()
+            self.assertEqual([-3 * 2 ** 70, 1], machine.output)
+
+
+class FastTest(Test):
+    """
+    every test above, with run() swapped out for run_fast()
+
+    step() and run_fast() share their handlers, so this checks the dispatch
+    around them against the expected values above. intcode_fuzz checks the
+    handlers themselves against an interpreter that shares nothing with them
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(Intcode, "run", Intcode.run_fast)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run_fast_stops_at_halt(self):
+        machine = Intcode("1101,1,1,5,99,0", 0)
+        machine.run_fast()
+        self.assertEqual(4, machine.ip)
+        self.assertEqual(2, machine.memory[5])
+
 
 if __name__ == "__main__":
     # unittest.main()
-    with open("inputs/day05.txt") as f:
-        source = f.read()
-
-    machine = Intcode(source, 5)
-    machine.run()
+    path = "inputs/day05.txt"
+    machine = Intcode(intcode_image.load(path), 5)
+    memo = intcode_memo.Memo(directory=intcode_image.cache_directory(path))
 
-    print(machine.output)
+    print(memo.run(machine).output)
@@ -1,2 +1,100 @@
+from collections import namedtuple
+import functools
+
+
 def digits(code):
     return [int(d) for d in str(code)]
+
+
+def non_decreasing(start, end):
+    """
+    every integer in [start, end] whose digits never go down, in ascending
+    order and without looking at any of the others
+
+    the first is start with every digit after its first drop raised to the
+    one before it. after that, the next one always comes from bumping the
+    last digit that isn't a 9 and copying it over everything after it
+    """
+    if start <= 0 <= end:
+        yield 0
+    code = digits(max(start, 1))
+    for i in range(1, len(code)):
+        if code[i] < code[i - 1]:
+            code[i:] = [code[i - 1]] * (len(code) - i)
+            break
+    while True:
+        number = int("".join(map(str, code)))
+        if number > end:
+            return
+        yield number
+        i = len(code) - 1
+        while i >= 0 and code[i] == 9:
+            i -= 1
+        if i < 0:
+            code = [1] * (len(code) + 1)
+        else:
+            code[i:] = [code[i] + 1] * (len(code) - i)
+
+
+# a digit automaton: start from initial, step(state, digit) gives the next
+# state, or None once the number can't be accepted whatever comes next, and
+# accepts(state) says whether a number ending there counts
+Automaton = namedtuple("Automaton", "initial step accepts")
+
+
+def count_accepted(automaton, start, end):
+    """
+    how many integers in [start, end] automaton accepts, reading their digits
+    left to right with no leading zeros
+
+    counts by dynamic programming over digit positions rather than looking at
+    every number, so it takes time in the number of digits and states, not
+    the size of the range
+    """
+    return _count_upto(automaton, end) - _count_upto(automaton, start - 1)
+
+
+def _count_upto(automaton, limit):
+    if limit <= 0:
+        return 0
+    initial, step, accepts = automaton
+
+    @functools.lru_cache(maxsize=None)
+    def completions(state, remaining):
+        """
+        ways to append remaining digits, any digits, from state
+        """
+        if remaining == 0:
+            return 1 if accepts(state) else 0
+        total = 0
+        for digit in range(10):
+            following = step(state, digit)
+            if following is not None:
+                total += completions(following, remaining - 1)
+        return total
+
+    limit_digits = digits(limit)
+    length = len(limit_digits)
+    total = 0
+
+    # every number shorter than limit
+    for shorter in range(1, length):
+        for digit in range(1, 10):
+            following = step(initial, digit)
+            if following is not None:
+                total += completions(following, shorter - 1)
+
+    # same length: match limit for a while, then go under it
+    state = initial
+    for position, limit_digit in enumerate(limit_digits):
+        for digit in range(1 if position == 0 else 0, limit_digit):
+            following = step(state, digit)
+            if following is not None:
+                total += completions(following, length - position - 1)
+        state = step(state, limit_digit)
+        if state is None:
+            break
+    else:
+        if accepts(state):
+            total += 1
+    return total
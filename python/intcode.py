@@ -0,0 +1,681 @@
+"""
+The Intcode machine shared by every day that uses one
+
+What each day's machine understands is an opcode set: a table of instruction
+-> Opcode (name, handler, how many parameter modes matter, which parameter it
+stores to) plus whether parameter modes exist at all. Day 2 only knows ADD
+and MULTIPLY and has no modes, day 5 part 1 adds INPUT and OUTPUT, day 5 part
+2 adds the jumps and comparisons. A day's Intcode is just this class with
+OPCODES set, so every engine feature (decode caching, run_fast, memory
+backends, resumable input) works for all of them.
+
+A handler takes the machine, its memory, the current ip and the modes of the
+first two parameters, and returns the next ip. Operands are read straight out
+of memory, and the store always comes last so a handler that overflows a
+typed memory backend can just be run again on a list.
+"""
+from array import array
+from collections import namedtuple
+import collections
+import copy
+import queue
+import unittest
+
+import helpers
+
+
+def parse(raw, chunk_size=1 << 16):
+    """
+    the cells of a program, from its source as str or bytes
+
+    raw is split a chunk at a time straight into an array of 64 bit ints, so
+    there's never a list of a string per cell, only per chunk. int() ignores
+    the whitespace around a number, so a trailing newline is fine. falls back
+    to a list if a cell doesn't fit in 64 bits
+    """
+    if isinstance(raw, str):
+        raw = raw.encode()
+    cells = array("q")
+    leftover = b""
+    for start in range(0, len(raw), chunk_size):
+        numbers = (leftover + raw[start:start + chunk_size]).split(b",")
+        # the last one might carry on into the next chunk
+        leftover = numbers.pop()
+        cells = _extend(cells, numbers)
+    # like every other cell, the last one can't be empty
+    return _extend(cells, [leftover])
+
+
+def image(cells):
+    """
+    cells as a program image, which machines copy into their memory and
+    never write to. an array of 64 bit ints or a read-only buffer of them (like
+    intcode_image maps) is used as is, anything else is packed into one, and
+    only falls back to a tuple if a cell doesn't fit
+    """
+    if isinstance(cells, array) and cells.typecode == "q":
+        return cells
+    if isinstance(cells, memoryview) and cells.format == "q":
+        return cells
+    try:
+        return array("q", cells)
+    except OverflowError:
+        return tuple(cells)
+
+
+def _extend(cells, numbers):
+    if isinstance(cells, array):
+        try:
+            cells.extend(array("q", map(int, numbers)))
+            return cells
+        except OverflowError:
+            cells = list(cells)
+    cells.extend(map(int, numbers))
+    return cells
+
+
+class _NeedsInput(Exception):
+    """
+    raised by the INPUT handler when there's no input to read
+    """
+
+
+class OutputFull(Exception):
+    """
+    raised by an output sink's append when it can't take any more. the
+    machine stops on the OUTPUT with status OUTPUT_FULL, and running it again
+    tries the OUTPUT again
+    """
+
+
+def _add(machine, memory, ip, mode_1, mode_2):
+    param_1 = memory[ip + 1]
+    if not mode_1:
+        param_1 = memory[param_1]
+    param_2 = memory[ip + 2]
+    if not mode_2:
+        param_2 = memory[param_2]
+    memory[memory[ip + 3]] = param_1 + param_2
+    return ip + 4
+
+
+def _multiply(machine, memory, ip, mode_1, mode_2):
+    param_1 = memory[ip + 1]
+    if not mode_1:
+        param_1 = memory[param_1]
+    param_2 = memory[ip + 2]
+    if not mode_2:
+        param_2 = memory[param_2]
+    memory[memory[ip + 3]] = param_1 * param_2
+    return ip + 4
+
+
+def _input(machine, memory, ip, mode_1, mode_2):
+    value = machine.read_input()
+    if value is None:
+        raise _NeedsInput
+    try:
+        memory[memory[ip + 1]] = value
+    except OverflowError:
+        # put it back for when this is run again on a list
+        machine.pending.appendleft(value)
+        raise
+    machine.status = machine.RUNNING
+    return ip + 2
+
+
+def _output(machine, memory, ip, mode_1, mode_2):
+    param = memory[ip + 1]
+    if not mode_1:
+        param = memory[param]
+    machine.output.append(param)
+    return ip + 2
+
+
+def _jump_if_true(machine, memory, ip, mode_1, mode_2):
+    param_1 = memory[ip + 1]
+    if not mode_1:
+        param_1 = memory[param_1]
+    if param_1 != 0:
+        param_2 = memory[ip + 2]
+        if not mode_2:
+            param_2 = memory[param_2]
+        return param_2
+    return ip + 3
+
+
+def _jump_if_false(machine, memory, ip, mode_1, mode_2):
+    param_1 = memory[ip + 1]
+    if not mode_1:
+        param_1 = memory[param_1]
+    if param_1 == 0:
+        param_2 = memory[ip + 2]
+        if not mode_2:
+            param_2 = memory[param_2]
+        return param_2
+    return ip + 3
+
+
+def _less_than(machine, memory, ip, mode_1, mode_2):
+    param_1 = memory[ip + 1]
+    if not mode_1:
+        param_1 = memory[param_1]
+    param_2 = memory[ip + 2]
+    if not mode_2:
+        param_2 = memory[param_2]
+    memory[memory[ip + 3]] = 1 if param_1 < param_2 else 0
+    return ip + 4
+
+
+def _equals(machine, memory, ip, mode_1, mode_2):
+    param_1 = memory[ip + 1]
+    if not mode_1:
+        param_1 = memory[param_1]
+    param_2 = memory[ip + 2]
+    if not mode_2:
+        param_2 = memory[param_2]
+    memory[memory[ip + 3]] = 1 if param_1 == param_2 else 0
+    return ip + 4
+
+
+# writes is the parameter holding the address the opcode stores to, or None if
+# it doesn't store. anything that watches for self-modification reads it
+Opcode = namedtuple("Opcode", "name handler modes_used writes",
+                    defaults=(None,))
+_Tee = namedtuple("_Tee", "append")
+
+
+class OpcodeSet:
+    def __init__(self, name, version, opcodes, modes=True):
+        """
+        version should go up whenever what the opcodes do changes, so results
+        cached from an older version aren't reused
+        """
+        self.name = name
+        self.version = version
+        self.opcodes = opcodes
+        self.modes = modes
+        # raw instruction value -> (handler, mode_1, mode_2), HALT maps to
+        # None. filled in by Intcode.fast_decode
+        self.dispatch = {}
+
+    def __repr__(self):
+        return f"OpcodeSet({self.name!r}, {self.version})"
+
+
+# name -> OpcodeSet
+OPCODE_SETS = {}
+
+
+def register(opcode_set):
+    OPCODE_SETS[opcode_set.name] = opcode_set
+    return opcode_set
+
+
+ARITHMETIC = {
+    1: Opcode("ADD", _add, 2, writes=3),
+    2: Opcode("MULTIPLY", _multiply, 2, writes=3),
+}
+IO = {
+    3: Opcode("INPUT", _input, 0, writes=1),
+    4: Opcode("OUTPUT", _output, 1),
+}
+JUMPS = {
+    5: Opcode("JUMP_IF_TRUE", _jump_if_true, 2),
+    6: Opcode("JUMP_IF_FALSE", _jump_if_false, 2),
+    7: Opcode("LESS_THAN", _less_than, 2, writes=3),
+    8: Opcode("EQUALS", _equals, 2, writes=3),
+}
+
+DAY_2 = register(OpcodeSet("day 2", 1, ARITHMETIC, modes=False))
+DAY_5_1 = register(OpcodeSet("day 5 part 1", 1, {**ARITHMETIC, **IO}))
+DAY_5_2 = register(OpcodeSet(
+    "day 5 part 2", 1, {**ARITHMETIC, **IO, **JUMPS}))
+
+
+class Intcode:
+
+    # instructions
+    ADD = 1
+    MULTIPLY = 2
+    INPUT = 3
+    OUTPUT = 4
+    JUMP_IF_TRUE = 5
+    JUMP_IF_FALSE = 6
+    LESS_THAN = 7
+    EQUALS = 8
+    HALT = 99
+
+    # modes
+    POSITION = 0
+    IMMEDIATE = 1
+
+    # statuses
+    RUNNING = "running"
+    NEEDS_INPUT = "needs input"
+    OUTPUT_FULL = "output full"
+    HALTED = "halted"
+
+    # what this machine understands, days pick theirs
+    OPCODES = DAY_5_2
+
+    def __init__(self, raw_source, inputs=(), memory=list, output=None):
+        """
+        inputs is either a single int, which every INPUT reads (like day 5),
+        a deque that can be appended to while the machine runs, an iterator,
+        which is read lazily, a queue.Queue that other threads put values in,
+        or any other collection of values. an empty queue means the machine
+        needs input, just like an empty deque
+
+        memory is the backend the parsed cells are stored in, see
+        intcode_memory. raw_source can also be cells that are already parsed
+
+        output is where OUTPUT sends values, anything with an append, see
+        intcode_sinks. by default it's a new list, which is what everything
+        reading machine.output afterwards expects
+        """
+        self.raw_source = raw_source
+        if getattr(memory, "PARSES", False):
+            # the backend parses the source itself, as cells are used
+            self.image = raw_source
+        else:
+            if isinstance(raw_source, str):
+                raw_source = self._parse(raw_source)
+            # parsed once, never written to and shared with forks. reset()
+            # copies it into memory
+            self.image = image(raw_source)
+        self.backend = memory
+
+        self.input = None
+        self.source = None
+        if isinstance(inputs, collections.deque):
+            self.pending = inputs
+        elif isinstance(inputs, int):
+            self.pending = collections.deque()
+            self.input = inputs
+        elif isinstance(inputs, queue.Queue) or iter(inputs) is inputs:
+            # an iterator, possibly endless, or a queue still being filled,
+            # so only read it when needed
+            self.pending = collections.deque()
+            self.source = inputs
+        else:
+            self.pending = collections.deque(inputs)
+
+        self.sink = output
+        self.reset()
+
+    def reset(self):
+        """
+        put memory, ip and output back to how the program started, without
+        parsing raw_source again. input is left alone
+        """
+        self.memory = self.backend(self.image)
+        self.ip = 0
+        # a sink can't be emptied, so it's kept
+        self.output = [] if self.sink is None else self.sink
+        self.status = Intcode.RUNNING
+        # instructions run() has executed
+        self.steps = 0
+
+    def fork(self):
+        """
+        a new machine at the start of the same program, sharing the image
+        and starting with a copy of the pending input
+        """
+        machine = copy.copy(self)
+        machine.pending = collections.deque(self.pending)
+        machine.reset()
+        return machine
+
+    def promote(self):
+        """
+        swap memory for a plain list, when a value doesn't fit the backend
+        """
+        self.memory = list(self.memory)
+        return self.memory
+
+    def unbounded_memory(self):
+        """
+        memory that any value can be stored in, for engines that run several
+        instructions at once. the interpreter can rerun the one instruction
+        whose store overflowed a typed backend once memory is a list, but a
+        compiled block or superinstruction can't be restarted half way
+        through, so those promote up front instead
+        """
+        if isinstance(self.memory, array):
+            self.promote()
+        return self.memory
+
+    def feed(self, *values):
+        """
+        queue up more input, read before anything passed to __init__
+        """
+        self.pending.extend(values)
+
+    def read_input(self):
+        """
+        next input value, or None if there isn't one yet
+        """
+        if self.pending:
+            return self.pending.popleft()
+        if isinstance(self.source, queue.Queue):
+            try:
+                return self.source.get_nowait()
+            except queue.Empty:
+                pass
+        elif self.source is not None:
+            value = next(self.source, None)
+            if value is not None:
+                return value
+        return self.input
+
+    def step(self):
+        """
+        Execute the current instruction at ip
+
+        Returns either the next value of ip, or None when opcode 99 is reached
+        or there's no input for an INPUT, with status saying which
+
+        May also raise ValueError if the current instruction pointed
+        at by ip is invalid
+        """
+        raw = self.memory[self.ip]
+        try:
+            handler, mode_1, mode_2 = self.OPCODES.dispatch[raw]
+        except KeyError:
+            handler, mode_1, mode_2 = self.fast_decode(raw, self.ip)
+
+        if handler is None:
+            self.status = self.HALTED
+            return None
+        try:
+            return handler(self, self.memory, self.ip, mode_1, mode_2)
+        except OverflowError:
+            return handler(self, self.promote(), self.ip, mode_1, mode_2)
+        except _NeedsInput:
+            self.status = self.NEEDS_INPUT
+            return None
+        except OutputFull:
+            self.status = self.OUTPUT_FULL
+            return None
+
+    def write_target(self, ip):
+        """
+        address the instruction at ip is about to store to, or None if it
+        doesn't store (or doesn't decode)
+        """
+        memory = self.memory
+        try:
+            instruction, _ = self.decode(memory[ip])
+            writes = self.OPCODES.opcodes[instruction].writes
+            if writes is None:
+                return None
+            return memory[ip + writes]
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def resolve(self, position_or_immediate, mode):
+        if mode == Intcode.IMMEDIATE:
+            return position_or_immediate
+        elif mode == Intcode.POSITION:
+            return self.memory[position_or_immediate]
+        else:
+            raise ValueError(f"Invalid mode {mode}")
+
+    # raw instruction value -> (instruction, modes), shared by every machine
+    _decoded = {}
+    NO_MODES = (POSITION, POSITION, POSITION)
+
+    def decode(self, instruction):
+        """
+        cached parse_instruction
+
+        decoding only depends on the raw value, so a program that writes over
+        its own code just looks up (or decodes) the new value, no invalidation
+        needed. callers must not mutate the returned modes
+        """
+        if not self.OPCODES.modes:
+            return (instruction, self.NO_MODES)
+        try:
+            return self._decoded[instruction]
+        except KeyError:
+            decoded = self.parse_instruction(instruction)
+            self._decoded[instruction] = decoded
+            return decoded
+
+    @staticmethod
+    def parse_instruction(instruction):
+        """
+        take a raw instruction (like 2, or 1002) and return an instruction and
+        list of modes
+        ie: 2 -> (2, [0, 0, 0])
+            1002 -> (2, [0, 1, 0])
+        """
+        if 0 < instruction < 100:
+            return (instruction, [Intcode.POSITION, Intcode.POSITION,
+                                  Intcode.POSITION])
+        modes = helpers.digits(instruction)
+
+        # combine rightmost 2 digits of instruction into new instruction
+        instruction = modes.pop() + (10 * modes.pop())
+
+        modes = list(reversed(modes))
+
+        while len(modes) < 3:
+            modes.append(Intcode.POSITION)
+
+        return (instruction, modes)
+
+    def fast_decode(self, raw, ip):
+        """
+        decode a raw instruction into an entry of the OPCODES dispatch table
+
+        modes are checked here, once per raw value, so the handlers can
+        treat anything that isn't POSITION as IMMEDIATE
+        """
+        instruction, modes = self.decode(raw)
+        if instruction == self.HALT:
+            entry = (None, None, None)
+        elif instruction in self.OPCODES.opcodes:
+            opcode = self.OPCODES.opcodes[instruction]
+            for mode in modes[:opcode.modes_used]:
+                if mode not in (Intcode.POSITION, Intcode.IMMEDIATE):
+                    raise ValueError(f"Invalid mode {mode}")
+            entry = (opcode.handler, modes[0], modes[1])
+        else:
+            raise ValueError(f'Invalid opcode {instruction} at {ip}')
+
+        self.OPCODES.dispatch[raw] = entry
+        return entry
+
+    def run(self, max_steps=None):
+        """
+        Run until the program halts or needs input it doesn't have yet, or
+        until max_steps instructions have been executed
+
+        Returns status, which is still RUNNING if it ran out of steps. After
+        NEEDS_INPUT, feed() it and run again to carry on from the INPUT
+        instruction
+        """
+        self.status = self.RUNNING
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            result = self.step()
+            if result is None:
+                break
+            self.ip = result
+            steps += 1
+        self.steps += steps
+        return self.status
+
+    def outputs(self):
+        """
+        Same as run, but yields each output as soon as it's produced
+        """
+        self.status = self.RUNNING
+        sink = self.output
+        produced = []
+
+        def append(value):
+            sink.append(value)
+            produced.append(value)
+
+        # sinks don't have to be indexable, so catch values on the way in
+        tee = _Tee(append)
+        while True:
+            self.output = tee
+            try:
+                result = self.step()
+            finally:
+                self.output = sink
+            if result is None:
+                return
+            self.ip = result
+            yield from produced
+            produced.clear()
+
+    def run_fast(self):
+        """
+        Same as run, but with the dispatch from step() inlined and the hot
+        state kept in locals
+        """
+        memory = self.memory
+        dispatch = self.OPCODES.dispatch
+        ip = self.ip
+        self.status = self.RUNNING
+        try:
+            while True:
+                raw = memory[ip]
+                try:
+                    handler, mode_1, mode_2 = dispatch[raw]
+                except KeyError:
+                    handler, mode_1, mode_2 = self.fast_decode(raw, ip)
+                if handler is None:
+                    self.status = self.HALTED
+                    break
+                try:
+                    ip = handler(self, memory, ip, mode_1, mode_2)
+                except OverflowError:
+                    # handlers store last, so just go again on a list
+                    memory = self.promote()
+        except _NeedsInput:
+            self.status = self.NEEDS_INPUT
+        except OutputFull:
+            self.status = self.OUTPUT_FULL
+        finally:
+            self.ip = ip
+        return self.status
+
+    def _parse(self, raw):
+        return parse(raw)
+
+
+class Test(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(array("q", [1101, 100, -1, 4, 0]),
+                         parse("1101,100,-1,4,0\n"))
+        self.assertEqual(array("q", [3, 0, 4, 0, 99]), parse(b"3,0,4,0,99"))
+        self.assertEqual(array("q", [0]), parse("0"))
+
+    def test_parse_across_chunks(self):
+        source = ",".join(str(i * (-1) ** i) for i in range(1000)) + "\n"
+        self.assertEqual(list(map(int, source.split(","))),
+                         list(parse(source, chunk_size=7)))
+
+    def test_parse_big(self):
+        cells = parse(f"1,{2 ** 70},-3", chunk_size=2)
+        self.assertEqual([1, 2 ** 70, -3], cells)
+
+    def test_parse_invalid(self):
+        with self.assertRaises(ValueError):
+            parse("1,,2")
+        with self.assertRaises(ValueError):
+            parse("")
+        with self.assertRaises(ValueError):
+            parse("1,2,\n")
+        with self.assertRaises(ValueError):
+            parse("1,2,", chunk_size=2)
+
+    def test_image(self):
+        cells = parse("1,2,3")
+        self.assertIs(cells, image(cells))
+        view = memoryview(cells).toreadonly()
+        self.assertIs(view, image(view))
+        self.assertEqual(array("q", [1, 2, 3]), image([1, 2, 3]))
+        self.assertEqual((1, 2 ** 70), image([1, 2 ** 70]))
+
+        machine = Intcode("1101,2,3,0,99")
+        self.assertIsInstance(machine.image, array)
+        machine.run()
+        self.assertEqual(1101, machine.image[0])
+        self.assertIs(machine.image, machine.fork().image)
+
+    def test_unbounded_memory(self):
+        machine = Intcode("1,0,0,0,99", memory=lambda cells: array("q", cells))
+        memory = machine.unbounded_memory()
+        self.assertIs(memory, machine.memory)
+        self.assertEqual([1, 0, 0, 0, 99], memory)
+        memory[0] = 2 ** 70
+        self.assertIs(memory, machine.unbounded_memory())
+
+    def test_registered(self):
+        self.assertIs(DAY_2, OPCODE_SETS["day 2"])
+        self.assertIs(DAY_5_2, OPCODE_SETS["day 5 part 2"])
+        self.assertEqual({1, 2, 3, 4}, set(DAY_5_1.opcodes))
+
+    def test_default_opcodes(self):
+        machine = Intcode("1105,1,4,98,99")
+        self.assertEqual(Intcode.HALTED, machine.run())
+
+    def test_no_modes(self):
+        class Day2(Intcode):
+            OPCODES = DAY_2
+
+        machine = Day2("1,0,0,0,99")
+        machine.run()
+        self.assertEqual([2, 0, 0, 0, 99], machine.memory)
+        with self.assertRaisesRegex(ValueError, "Invalid opcode 1002 at 0"):
+            Day2("1002,4,3,4,33").run()
+
+    def test_missing_opcode(self):
+        class Day51(Intcode):
+            OPCODES = DAY_5_1
+
+        with self.assertRaisesRegex(ValueError, "Invalid opcode 5 at 0"):
+            Day51("1105,1,4,98,99").run()
+
+    def test_custom_opcodes(self):
+        def _negate(machine, memory, ip, mode_1, mode_2):
+            memory[memory[ip + 1]] = -memory[memory[ip + 1]]
+            return ip + 2
+
+        class Negating(Intcode):
+            OPCODES = OpcodeSet("negate", 1, {
+                **ARITHMETIC, 9: Opcode("NEGATE", _negate, 0, writes=1)})
+
+        machine = Negating("9,3,99,7")
+        self.assertEqual(3, machine.write_target(0))
+        machine.run_fast()
+        self.assertEqual(-7, machine.memory[3])
+        self.assertIsNone(machine.write_target(2))
+
+    def test_max_steps(self):
+        # count down from 3, outputting each number
+        machine = Intcode("1101,0,3,14,4,14,1001,14,-1,14,1005,14,4,99,0")
+        self.assertEqual(Intcode.RUNNING, machine.run(max_steps=2))
+        self.assertEqual((6, 2, [3]), (machine.ip, machine.steps,
+                                       machine.output))
+        self.assertEqual(Intcode.RUNNING, machine.run(max_steps=0))
+        self.assertEqual(Intcode.HALTED, machine.run(max_steps=100))
+        self.assertEqual([3, 2, 1], machine.output)
+        self.assertEqual(10, machine.steps)
+
+    def test_fork(self):
+        machine = Intcode("3,0,4,0,99", [5])
+        machine.feed(6)
+        fork = machine.fork()
+        machine.run()
+        fork.run()
+        self.assertEqual([5], machine.output)
+        self.assertEqual([5], fork.output)
+        self.assertEqual([6], list(fork.pending))
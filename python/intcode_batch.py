@@ -0,0 +1,314 @@
+"""
+Run the same day 5 program against lots of inputs at once
+
+Memory for N machines is one (N, length) int64 matrix, with ip, input and
+running flags as vectors next to it. Each step looks at which instruction
+every running machine is sitting on, and runs each group of machines on the
+same instruction as a single vectorized operation. Machines that branch
+differently just end up in different groups, and halted ones are masked out.
+A machine that hits an invalid opcode or mode, or reads or writes an address
+outside memory, stops with its error recorded in errors instead of taking the
+whole batch down. Addresses are checked in the order the interpreter's
+handlers touch them, so the same machines fail, with the same kind of error.
+
+Cells are int64. Intcode's values can grow as big as they like, so an ADD or
+MULTIPLY whose result doesn't fit stops its machine with an OverflowError
+rather than wrapping round to the wrong answer.
+"""
+import unittest
+
+import numpy as np
+
+from intcode import Intcode
+
+
+INT64 = np.iinfo(np.int64)
+
+
+class Batch:
+
+    # instruction -> number of parameters whose mode gets looked at
+    MODES_USED = {
+        Intcode.HALT: 0,
+        Intcode.ADD: 2,
+        Intcode.MULTIPLY: 2,
+        Intcode.INPUT: 0,
+        Intcode.OUTPUT: 1,
+        Intcode.JUMP_IF_TRUE: 2,
+        Intcode.JUMP_IF_FALSE: 2,
+        Intcode.LESS_THAN: 2,
+        Intcode.EQUALS: 2,
+    }
+
+    def __init__(self, raw_source, inputs):
+        image = np.array(Intcode(raw_source, 0).memory, dtype=np.int64)
+        self.input = np.array(inputs, dtype=np.int64)
+        self.memory = np.tile(image, (len(self.input), 1))
+        self.ip = np.zeros(len(self.input), dtype=np.int64)
+        self.running = np.ones(len(self.input), dtype=bool)
+        self.output = [[] for _ in self.input]
+        # machine -> ValueError, IndexError or OverflowError that stopped it
+        self.errors = {}
+
+    def run(self):
+        while self.step():
+            pass
+
+    def step(self):
+        """
+        Execute one instruction on every running machine
+
+        Returns the number of machines that were running
+        """
+        machines = np.flatnonzero(self.running)
+        if len(machines) == 0:
+            return 0
+
+        length = self.memory.shape[1]
+        ip = self.ip[machines]
+        outside = (ip < -length) | (ip >= length)
+        for machine in machines[outside]:
+            self.fault(machine, IndexError(
+                f"ip {self.ip[machine]} out of range"))
+        machines = machines[~outside]
+
+        raw = self.memory[machines, self.ip[machines]]
+        # negative instructions don't decode in Intcode either
+        instructions = np.where(raw < 0, -1, raw % 100)
+        for instruction in np.unique(instructions):
+            group = instructions == instruction
+            used = self.MODES_USED.get(int(instruction))
+            if used is None:
+                for machine in machines[group]:
+                    self.fault(machine, ValueError(
+                        f'Invalid opcode {instruction} at {self.ip[machine]}'))
+                continue
+
+            valid = group.copy()
+            for offset in range(1, used + 1):
+                mode = raw // (10 ** (offset + 1)) % 10
+                bad = valid & (mode > Intcode.IMMEDIATE)
+                for machine, value in zip(machines[bad], mode[bad]):
+                    self.fault(machine, ValueError(f"Invalid mode {value}"))
+                valid &= ~bad
+            valid[valid] = self.in_range(
+                int(instruction), machines[valid], raw[valid])
+            if valid.any():
+                self.execute(int(instruction), machines[valid], raw[valid])
+
+        return len(machines)
+
+    def in_range(self, instruction, machines, raw):
+        """
+        mask of the machines whose instruction only touches addresses inside
+        memory. the rest are faulted with an IndexError
+        """
+        memory = self.memory
+        length = memory.shape[1]
+        ip = self.ip[machines]
+        ok = np.ones(len(machines), dtype=bool)
+        everyone = ok.copy()
+
+        def touch(addresses, needed):
+            """
+            check the addresses of the machines in needed, returning them
+            with anything that isn't safe to index with replaced by 0
+            """
+            bad = ok & needed & ((addresses < -length) | (addresses >= length))
+            for machine, address in zip(machines[bad], addresses[bad]):
+                self.fault(machine, IndexError(
+                    f"Address {address} out of range at {self.ip[machine]}"))
+            ok[bad] = False
+            return np.where(ok & needed, addresses, 0)
+
+        def read(addresses, needed):
+            return memory[machines, touch(addresses, needed)]
+
+        def operand(offset, needed):
+            value = read(ip + offset, needed)
+            mode = raw // (10 ** (offset + 1)) % 10
+            position = mode == Intcode.POSITION
+            return np.where(position, read(value, needed & position), value)
+
+        if instruction in (Intcode.ADD, Intcode.MULTIPLY, Intcode.LESS_THAN,
+                           Intcode.EQUALS):
+            operand(1, everyone)
+            operand(2, everyone)
+            touch(read(ip + 3, everyone), everyone)
+        elif instruction == Intcode.INPUT:
+            touch(read(ip + 1, everyone), everyone)
+        elif instruction == Intcode.OUTPUT:
+            operand(1, everyone)
+        elif instruction in (Intcode.JUMP_IF_TRUE, Intcode.JUMP_IF_FALSE):
+            value = operand(1, everyone)
+            taken = (value != 0) == (instruction == Intcode.JUMP_IF_TRUE)
+            # the target's only read when the jump is taken
+            operand(2, taken)
+        return ok
+
+    def fault(self, machine, error):
+        self.errors[int(machine)] = error
+        self.running[machine] = False
+
+    def execute(self, instruction, machines, raw):
+        memory = self.memory
+        length = memory.shape[1]
+        ip = self.ip[machines]
+
+        def param(offset):
+            return memory[machines, ip + offset]
+
+        def resolve(offset):
+            value = param(offset)
+            mode = raw // (10 ** (offset + 1)) % 10
+            # only look up positions, immediates can be anything. in_range
+            # has checked every position that matters, the only ones left out
+            # of range are targets of jumps that aren't taken
+            position = (mode == Intcode.POSITION) & (value >= -length) & (
+                value < length)
+            looked_up = memory[machines, np.where(position, value, 0)]
+            return np.where(mode == Intcode.POSITION, looked_up, value)
+
+        if instruction == Intcode.HALT:
+            self.running[machines] = False
+        elif instruction in (Intcode.ADD, Intcode.MULTIPLY):
+            # worked out as python ints, so a result too big for the matrix
+            # is caught instead of wrapping
+            operand_1 = resolve(1).astype(object)
+            operand_2 = resolve(2).astype(object)
+            if instruction == Intcode.ADD:
+                results = operand_1 + operand_2
+            else:
+                results = operand_1 * operand_2
+            fits = ((results >= INT64.min) & (results <= INT64.max)).astype(
+                bool)
+            for machine, value in zip(machines[~fits], results[~fits]):
+                self.fault(machine, OverflowError(
+                    f"{value} at {self.ip[machine]} doesn't fit in 64 bits"))
+            machines, ip = machines[fits], ip[fits]
+            memory[machines, param(3)] = results[fits].astype(np.int64)
+            self.ip[machines] = ip + 4
+        elif instruction == Intcode.INPUT:
+            memory[machines, param(1)] = self.input[machines]
+            self.ip[machines] = ip + 2
+        elif instruction == Intcode.OUTPUT:
+            for machine, value in zip(machines, resolve(1)):
+                self.output[machine].append(int(value))
+            self.ip[machines] = ip + 2
+        elif instruction == Intcode.JUMP_IF_TRUE:
+            self.ip[machines] = np.where(resolve(1) != 0, resolve(2), ip + 3)
+        elif instruction == Intcode.JUMP_IF_FALSE:
+            self.ip[machines] = np.where(resolve(1) == 0, resolve(2), ip + 3)
+        elif instruction == Intcode.LESS_THAN:
+            memory[machines, param(3)] = resolve(1) < resolve(2)
+            self.ip[machines] = ip + 4
+        elif instruction == Intcode.EQUALS:
+            memory[machines, param(3)] = resolve(1) == resolve(2)
+            self.ip[machines] = ip + 4
+
+
+class Test(unittest.TestCase):
+    COMPARATOR = (
+        "3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,1106,"
+        "0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,999,1105,1,"
+        "46,1101,1000,1,20,4,20,1105,1,46,98,99")
+
+    def assertMatchesIntcode(self, source, inputs):
+        batch = Batch(source, inputs)
+        batch.run()
+        for i, value in enumerate(inputs):
+            machine = Intcode(source, value)
+            machine.run()
+            self.assertEqual(machine.output, batch.output[i])
+            self.assertEqual(machine.memory, batch.memory[i].tolist())
+            self.assertEqual(machine.ip, batch.ip[i])
+
+    def test_arithmetic(self):
+        self.assertMatchesIntcode("1,9,10,3,2,3,11,0,99,30,40,50", [0, 1])
+        self.assertMatchesIntcode("1002,4,3,4,33", [0])
+        self.assertMatchesIntcode("1101,100,-1,4,0", [0])
+
+    def test_input_output(self):
+        self.assertMatchesIntcode("3,0,4,0,99", [-3, 0, 42])
+
+    def test_comparisons(self):
+        inputs = list(range(-2, 12))
+        self.assertMatchesIntcode("3,9,8,9,10,9,4,9,99,-1,8", inputs)
+        self.assertMatchesIntcode("3,9,7,9,10,9,4,9,99,-1,8", inputs)
+        self.assertMatchesIntcode("3,3,1108,-1,8,3,4,3,99", inputs)
+        self.assertMatchesIntcode("3,3,1107,-1,8,3,4,3,99", inputs)
+
+    def test_diverging_machines(self):
+        self.assertMatchesIntcode(self.COMPARATOR, list(range(0, 20)))
+
+    def test_invalid_opcode(self):
+        batch = Batch("3,3,1105,0,6,99,98", [0, 1])
+        batch.run()
+        self.assertEqual([1], list(batch.errors))
+        self.assertEqual("Invalid opcode 98 at 6", str(batch.errors[1]))
+        self.assertEqual([5, 6], batch.ip.tolist())
+
+    def test_out_of_range(self):
+        # output whatever's at the address the input says
+        inputs = [0, 1000, -6, 2]
+        batch = Batch("3,3,4,0,99", inputs)
+        batch.run()
+        self.assertEqual([1, 2], sorted(batch.errors))
+        self.assertEqual("Address 1000 out of range at 2",
+                         str(batch.errors[1]))
+        for machine, value in enumerate(inputs):
+            intcode = Intcode("3,3,4,0,99", value)
+            if machine in batch.errors:
+                self.assertIsInstance(batch.errors[machine], IndexError)
+                self.assertRaises(IndexError, intcode.run)
+            else:
+                intcode.run()
+                self.assertEqual(intcode.output, batch.output[machine])
+
+    def test_jump_out_of_range(self):
+        # jump to what's at 100, which isn't there, if the input isn't 0
+        source = "3,9,5,9,100,104,5,99,0,0"
+        batch = Batch(source, [0, 1])
+        batch.run()
+        self.assertEqual([5], batch.output[0])
+        self.assertEqual({1}, set(batch.errors))
+        self.assertEqual("Address 100 out of range at 2",
+                         str(batch.errors[1]))
+
+    def test_overflow(self):
+        # multiply the input by 2 ** 62, then add the input
+        source = "3,13,1002,13,4611686018427387904,14,1,13,14,14,4,14,99,0,0"
+        inputs = [0, 1, -1, 2, -2, 4]
+        batch = Batch(source, inputs)
+        batch.run()
+        # -2 * 2 ** 62 just fits, it's adding -2 that doesn't
+        self.assertEqual({3: 2, 4: 6, 5: 2},
+                         {machine: batch.ip[machine]
+                          for machine in batch.errors})
+        self.assertEqual(
+            "9223372036854775808 at 2 doesn't fit in 64 bits",
+            str(batch.errors[3]))
+        for machine, value in enumerate(inputs):
+            intcode = Intcode(source, value)
+            intcode.run()
+            if machine in batch.errors:
+                self.assertIsInstance(batch.errors[machine], OverflowError)
+            else:
+                self.assertEqual(intcode.output, batch.output[machine])
+
+    def test_invalid_mode(self):
+        batch = Batch("3,3,1105,0,6,99,2201,0,0,0,99", [0, 1])
+        batch.run()
+        self.assertEqual("Invalid mode 2", str(batch.errors[1]))
+        self.assertNotIn(0, batch.errors)
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    batch = Batch(source, range(10))
+    batch.run()
+
+    for value, output in enumerate(batch.output):
+        print(value, batch.errors.get(value, output))
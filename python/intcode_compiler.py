@@ -0,0 +1,262 @@
+"""
+Compile Intcode programs into python functions, one per basic block
+
+A block starts wherever execution lands and runs straight-line up to and
+including the next jump. ADD, MULTIPLY, LESS_THAN and EQUALS are turned into
+plain python statements. INPUT, OUTPUT, HALT and anything that doesn't decode
+end the block and are left to Intcode.step()
+
+Intcode can rewrite itself (see test_run_with_modes), so every store checks
+whether it landed on compiled code. If it did, the blocks covering that cell
+are thrown away, the cell is marked dirty and execution goes back to the
+dispatcher. Dirty cells are never compiled again: instructions that touch them
+run through the interpreter from then on
+"""
+from unittest import mock
+
+import day_05_2
+import intcode
+from intcode import Intcode
+
+
+class Compiler:
+
+    # instructions that get compiled inline, and how
+    OPERATORS = {
+        Intcode.ADD: "{0} + {1}",
+        Intcode.MULTIPLY: "{0} * {1}",
+        Intcode.LESS_THAN: "1 if {0} < {1} else 0",
+        Intcode.EQUALS: "1 if {0} == {1} else 0",
+    }
+    JUMPS = {
+        Intcode.JUMP_IF_TRUE: "if {0} != 0:",
+        Intcode.JUMP_IF_FALSE: "if {0} == 0:",
+    }
+
+    # generated source -> function, shared by every compiler so running the
+    # same program over and over only pays for compile() once per block
+    _code = {}
+    # (opcode set, block start) -> (cells the block was compiled from,
+    # function), so a machine running an image seen before can skip decoding
+    # altogether
+    _seen = {}
+
+    def __init__(self, machine):
+        self.machine = machine
+        # block start -> function, or False if the interpreter handles it
+        self.blocks = {}
+        # block start -> addresses of the instructions compiled into it
+        self.extents = {}
+        # code address -> starts of the blocks it belongs to
+        self.owners = {}
+        self.dirty = set()
+
+    def run(self):
+        machine = self.machine
+        memory = machine.unbounded_memory()
+        blocks = self.blocks
+        owners = self.owners
+        invalidate = self.invalidate
+        ip = machine.ip
+        machine.status = machine.RUNNING
+        while True:
+            block = blocks.get(ip)
+            if block is None:
+                block = self.compile(ip)
+            if block:
+                ip = block(memory, owners, invalidate)
+                continue
+
+            machine.ip = ip
+            target = machine.write_target(ip)
+            result = machine.step()
+            if target in owners:
+                invalidate(target)
+            if result is None:
+                break
+            ip = result
+        machine.ip = ip
+        return machine.status
+
+    def invalidate(self, address):
+        """
+        forget every block containing address, which has just been written
+        """
+        self.dirty.add(address)
+        for start in self.owners.pop(address, ()):
+            self.blocks.pop(start, None)
+            for cell in self.extents.pop(start, ()):
+                starts = self.owners.get(cell)
+                if starts is not None:
+                    starts.discard(start)
+                    if not starts:
+                        del self.owners[cell]
+
+    def compile(self, start):
+        """
+        compile the block starting at start, returning the function or False
+        if there's nothing here worth compiling
+        """
+        memory = self.machine.memory
+        opcodes = self.machine.OPCODES
+        seen = self._seen.get((opcodes, start))
+        if seen is not None:
+            cells, block = seen
+            end = start + len(cells)
+            if (tuple(memory[start:end]) == cells
+                    and self.dirty.isdisjoint(range(start, end))):
+                return self.register(start, end, block)
+
+        lines = []
+        ip = start
+        while True:
+            try:
+                instruction, modes = self.machine.decode(memory[ip])
+            except (IndexError, ValueError):
+                break
+
+            if instruction not in opcodes.opcodes:
+                break
+            elif instruction in self.OPERATORS:
+                width = 4
+            elif instruction in self.JUMPS:
+                width = 3
+            else:
+                break
+            cells = range(ip, ip + width)
+            if ip + width > len(memory) or self.dirty.intersection(cells):
+                break
+            params = memory[ip + 1:ip + width]
+            try:
+                operand_1 = self.operand(params[0], modes[0])
+                operand_2 = self.operand(params[1], modes[1])
+            except ValueError:
+                break
+
+            if instruction in self.JUMPS:
+                lines.append(self.JUMPS[instruction].format(operand_1))
+                lines.append(f"    return {operand_2}")
+                ip += width
+                break
+
+            save_addr = params[2]
+            expression = self.OPERATORS[instruction].format(
+                operand_1, operand_2)
+            lines.append(f"memory[{save_addr}] = {expression}")
+            lines.append(f"if {save_addr} in owners:")
+            lines.append(f"    invalidate({save_addr})")
+            lines.append(f"    return {ip + width}")
+            ip += width
+
+        if not lines:
+            self.blocks[start] = False
+            return False
+
+        lines.append(f"return {ip}")
+        source = "def block(memory, owners, invalidate):\n" + "".join(
+            f"    {line}\n" for line in lines)
+        block = self._code.get(source)
+        if block is None:
+            namespace = {}
+            exec(compile(source, "<intcode block>", "exec"), namespace)
+            block = self._code[source] = namespace["block"]
+
+        self._seen[opcodes, start] = (tuple(memory[start:ip]), block)
+        return self.register(start, ip, block)
+
+    def register(self, start, end, block):
+        self.blocks[start] = block
+        self.extents[start] = range(start, end)
+        for cell in self.extents[start]:
+            self.owners.setdefault(cell, set()).add(start)
+        return block
+
+    @staticmethod
+    def operand(param, mode):
+        if mode == Intcode.IMMEDIATE:
+            return str(param)
+        elif mode == Intcode.POSITION:
+            return f"memory[{param}]"
+        else:
+            raise ValueError(f"Invalid mode {mode}")
+
+
+class CompiledTest(day_05_2.Test):
+    """
+    every day 5 test, with run() swapped out for the compiler
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            Intcode, "run", lambda machine: Compiler(machine).run())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_blocks_end_at_jumps(self):
+        machine = Intcode("1101,1,2,7,1105,1,9,0,99,99", 0)
+        compiler = Compiler(machine)
+        compiler.run()
+        self.assertEqual([0], list(compiler.extents))
+        self.assertEqual(range(0, 7), compiler.extents[0])
+        self.assertEqual(3, machine.memory[7])
+        self.assertEqual(9, machine.ip)
+
+    def test_write_into_block_invalidates_it(self):
+        # the first add patches the immediate operand of the second one
+        machine = Intcode("1101,5,0,5,1101,0,0,11,4,11,99,0", 0)
+        compiler = Compiler(machine)
+        compiler.run()
+        self.assertEqual([5], machine.output)
+        self.assertIn(5, compiler.dirty)
+        self.assertNotIn(5, compiler.owners)
+        self.assertFalse(compiler.blocks[4])
+
+    def test_custom_opcode_invalidates(self):
+        def _negate(machine, memory, ip, mode_1, mode_2):
+            memory[memory[ip + 1]] = -memory[memory[ip + 1]]
+            return ip + 2
+
+        class Negating(intcode.Intcode):
+            OPCODES = intcode.OpcodeSet("negate", 1, {
+                **intcode.DAY_5_2.opcodes,
+                9: intcode.Opcode("NEGATE", _negate, 0, writes=1)})
+
+        # the first time round, the negate at 7 flips the 5 at 2 in the block
+        # at 0, which then runs again and outputs what it stores
+        source = "1101,0,5,19,1005,20,16,9,2,1101,0,1,20,1105,1,0,4,19,99,0,0"
+        machine = Negating(source)
+        machine.run()
+        self.assertEqual([-5], machine.output)
+        machine = Negating(source)
+        compiler = Compiler(machine)
+        compiler.run()
+        self.assertEqual([-5], machine.output)
+        self.assertIn(2, compiler.dirty)
+
+    def test_same_block_compiled_once(self):
+        source = "1101,2,3,5,99,0"
+        first = Compiler(Intcode(source, 0))
+        first.run()
+        second = Compiler(Intcode(source, 0))
+        second.run()
+        self.assertIs(first.blocks[0], second.blocks[0])
+
+    def test_only_compiles_known_opcodes(self):
+        class Day2(intcode.Intcode):
+            OPCODES = intcode.DAY_2
+
+        Compiler(Intcode("1105,1,3,99", 0)).run()
+        compiler = Compiler(Day2("1105,1,3,99"))
+        with self.assertRaisesRegex(ValueError, "Invalid opcode 1105"):
+            compiler.run()
+        self.assertFalse(compiler.blocks[0])
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    machine = Intcode(source, 5)
+    Compiler(machine).run()
+
+    print(machine.output)
@@ -0,0 +1,351 @@
+"""
+Fuse common runs of Intcode instructions into single superinstructions
+
+Programs like the day 5 diagnostic are full of a LESS_THAN or EQUALS followed
+by a jump on the cell it just wrote, and of ADDs and MULTIPLYs feeding each
+other through temporary cells. Fusion finds these statically: it builds a
+control flow graph of basic blocks over the program (a block starts at 0, at
+every immediate jump target and after every jump or HALT, and ends at the
+next jump or HALT), and inside each block groups runs of arithmetic plus the
+jump that ends them. Each group becomes one python function, so the whole run
+costs one dispatch instead of one per instruction, and a value stored by one
+instruction and read by the next never goes back through memory.
+
+Intcode can rewrite itself, so every superinstruction starts by checking that
+the cells it was built from are still there. If they aren't it bails out, is
+thrown away, and those instructions go back through normal dispatch.
+"""
+from collections import namedtuple
+from unittest import mock
+
+import day_05_2
+import intcode
+from intcode import Intcode
+
+# writes is the address the instruction stores to, or None
+Instruction = namedtuple("Instruction", "ip instruction modes params writes")
+
+WIDTHS = {
+    Intcode.ADD: 4,
+    Intcode.MULTIPLY: 4,
+    Intcode.INPUT: 2,
+    Intcode.OUTPUT: 2,
+    Intcode.JUMP_IF_TRUE: 3,
+    Intcode.JUMP_IF_FALSE: 3,
+    Intcode.LESS_THAN: 4,
+    Intcode.EQUALS: 4,
+    Intcode.HALT: 1,
+}
+
+# instructions that get fused, and how
+OPERATORS = {
+    Intcode.ADD: "{0} + {1}",
+    Intcode.MULTIPLY: "{0} * {1}",
+    Intcode.LESS_THAN: "1 if {0} < {1} else 0",
+    Intcode.EQUALS: "1 if {0} == {1} else 0",
+}
+JUMPS = {
+    Intcode.JUMP_IF_TRUE: "if {0} != 0:",
+    Intcode.JUMP_IF_FALSE: "if {0} == 0:",
+}
+
+
+def decode(machine, memory, ip):
+    """
+    the Instruction at ip, or None if it isn't one machine understands
+    """
+    try:
+        instruction, modes = machine.decode(memory[ip])
+    except (IndexError, ValueError):
+        return None
+    if instruction == Intcode.HALT:
+        return Instruction(ip, instruction, modes, (), None)
+    if instruction not in machine.OPCODES.opcodes or instruction not in WIDTHS:
+        return None
+    width = WIDTHS[instruction]
+    if ip + width > len(memory):
+        return None
+    params = tuple(memory[ip + 1:ip + width])
+    if any(mode not in (Intcode.POSITION, Intcode.IMMEDIATE)
+           for mode in modes[:len(params)]):
+        return None
+    writes = machine.OPCODES.opcodes[instruction].writes
+    if writes is not None:
+        writes = params[writes - 1]
+    # every address a fused instruction touches is a constant, so one that
+    # would fault is caught here and left to the interpreter, which stops
+    # with ip on it, rather than half way through a superinstruction
+    addresses = [param for param, mode in zip(params, modes)
+                 if mode == Intcode.POSITION]
+    if writes is not None:
+        addresses.append(writes)
+    try:
+        for address in addresses:
+            memory[address]
+    except IndexError:
+        return None
+    return Instruction(ip, instruction, modes, params, writes)
+
+
+def basic_blocks(machine):
+    """
+    {start: [Instruction, ...]} for every block reachable from 0 through
+    fall through and immediate jumps
+
+    a block stops early at anything that doesn't decode, that's left to the
+    interpreter. jumps through position mode go wherever memory says at
+    runtime, so those targets aren't known here
+    """
+    memory = machine.memory
+    blocks = {}
+    leaders = [0]
+    while leaders:
+        start = leaders.pop()
+        if start in blocks:
+            continue
+        block = blocks[start] = []
+        ip = start
+        while True:
+            current = decode(machine, memory, ip)
+            if current is None:
+                break
+            block.append(current)
+            ip += WIDTHS[current.instruction]
+            if current.instruction in JUMPS:
+                if current.modes[1] == Intcode.IMMEDIATE:
+                    leaders.append(current.params[1])
+                leaders.append(ip)
+                break
+            if current.instruction == Intcode.HALT:
+                break
+            if ip in blocks:
+                break
+    return blocks
+
+
+def groups(block):
+    """
+    split a block into the runs worth fusing: two or more arithmetic
+    instructions, or at least one followed by the jump that ends the block
+
+    a run stops before any instruction that an earlier one in the run stores
+    into, so everything in a group can be read before the group starts
+    """
+    found = []
+    i = 0
+    while i < len(block):
+        group = []
+        stores = set()
+        for current in block[i:]:
+            if current.instruction not in OPERATORS and (
+                    current.instruction not in JUMPS or not group):
+                break
+            cells = range(current.ip, current.ip + 1 + len(current.params))
+            if not stores.isdisjoint(cells):
+                break
+            group.append(current)
+            if current.instruction in JUMPS:
+                break
+            if current.writes is not None:
+                stores.add(current.writes)
+        if len(group) >= 2:
+            found.append(group)
+        i += max(len(group), 1)
+    return found
+
+
+def source(group):
+    """
+    python source for a function that runs every instruction in group and
+    returns the next ip, or None if the group's cells have changed
+    """
+    start = group[0].ip
+    end = group[-1].ip + 1 + len(group[-1].params)
+    # address -> local holding what the group last stored there
+    stored = {}
+
+    def operand(param, mode):
+        if mode == Intcode.IMMEDIATE:
+            return str(param)
+        return stored.get(param, f"memory[{param}]")
+
+    lines = [
+        f"if memory[{start}:{end}] != cells:",
+        "    return None",
+    ]
+    for number, current in enumerate(group):
+        operand_1 = operand(current.params[0], current.modes[0])
+        operand_2 = operand(current.params[1], current.modes[1])
+        if current.instruction in JUMPS:
+            lines.append(JUMPS[current.instruction].format(operand_1))
+            lines.append(f"    return {operand_2}")
+            break
+        save_addr = current.writes
+        expression = OPERATORS[current.instruction].format(
+            operand_1, operand_2)
+        lines.append(f"value_{number} = {expression}")
+        lines.append(f"memory[{save_addr}] = value_{number}")
+        stored[save_addr] = f"value_{number}"
+    lines.append(f"return {end}")
+    return "def fused(memory, cells):\n" + "".join(
+        f"    {line}\n" for line in lines)
+
+
+class Fusion:
+
+    # generated source -> function, shared by every machine
+    _code = {}
+
+    def __init__(self, machine):
+        self.machine = machine
+        # group start -> (function, cells it was built from)
+        self.fused = {}
+        for block in basic_blocks(machine).values():
+            for group in groups(block):
+                self.fuse(group)
+
+    def fuse(self, group):
+        memory = self.machine.memory
+        start = group[0].ip
+        end = group[-1].ip + 1 + len(group[-1].params)
+        code = source(group)
+        function = self._code.get(code)
+        if function is None:
+            namespace = {}
+            exec(compile(code, "<intcode superinstruction>", "exec"),
+                 namespace)
+            function = self._code[code] = namespace["fused"]
+        self.fused[start] = (function, list(memory[start:end]))
+
+    def run(self):
+        """
+        Same as machine.run_fast(), but running superinstructions wherever
+        one starts
+        """
+        machine = self.machine
+        memory = machine.unbounded_memory()
+        fused = self.fused
+        dispatch = machine.OPCODES.dispatch
+        ip = machine.ip
+        machine.status = machine.RUNNING
+        try:
+            while True:
+                superinstruction = fused.get(ip)
+                if superinstruction is not None:
+                    function, cells = superinstruction
+                    next_ip = function(memory, cells)
+                    if next_ip is not None:
+                        ip = next_ip
+                        continue
+                    # overwritten since it was fused
+                    del fused[ip]
+
+                raw = memory[ip]
+                try:
+                    handler, mode_1, mode_2 = dispatch[raw]
+                except KeyError:
+                    handler, mode_1, mode_2 = machine.fast_decode(raw, ip)
+                if handler is None:
+                    machine.status = machine.HALTED
+                    break
+                ip = handler(machine, memory, ip, mode_1, mode_2)
+        except intcode._NeedsInput:
+            machine.status = machine.NEEDS_INPUT
+        except intcode.OutputFull:
+            machine.status = machine.OUTPUT_FULL
+        finally:
+            machine.ip = ip
+        return machine.status
+
+
+class FusedTest(day_05_2.Test):
+    """
+    every day 5 test, with run() swapped out for fusion
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            Intcode, "run", lambda machine: Fusion(machine).run())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # compare input to 8, jump to output 1 if equal, otherwise output 0
+    COMPARE = "3,12,1008,12,8,13,1005,13,11,104,0,99,0,0"
+
+    def test_basic_blocks(self):
+        machine = Intcode(self.COMPARE, 8)
+        blocks = basic_blocks(machine)
+        self.assertEqual([0, 9, 11], sorted(blocks))
+        self.assertEqual(
+            [Intcode.INPUT, Intcode.EQUALS, Intcode.JUMP_IF_TRUE],
+            [current.instruction for current in blocks[0]])
+        self.assertEqual(
+            [Intcode.OUTPUT, Intcode.HALT],
+            [current.instruction for current in blocks[9]])
+
+    def test_compare_and_jump(self):
+        fusion = Fusion(Intcode(self.COMPARE, 8))
+        self.assertEqual([2], list(fusion.fused))
+        fusion.run()
+        self.assertEqual([], fusion.machine.output)
+        self.assertEqual(1, fusion.machine.memory[13])
+
+        fusion = Fusion(Intcode(self.COMPARE, 7))
+        fusion.run()
+        self.assertEqual([0], fusion.machine.output)
+
+    def test_chain(self):
+        # (2 + 3) * 4 through the temporary at 13
+        machine = Intcode("1101,2,3,13,1002,13,4,14,4,14,99,0,0,0,0", 0)
+        group, = groups(basic_blocks(machine)[0])
+        self.assertIn("value_1 = value_0 * 4", source(group))
+        fusion = Fusion(machine)
+        fusion.run()
+        self.assertEqual([20], machine.output)
+
+    def test_fault_leaves_ip_on_it(self):
+        # the second add reads from 100, which is past the end of memory
+        source = "1101,1,2,9,1,100,9,9,99,0"
+        for run in (Intcode.run_fast, lambda machine: Fusion(machine).run()):
+            machine = Intcode(source)
+            with self.assertRaises(IndexError):
+                run(machine)
+            self.assertEqual(4, machine.ip)
+            self.assertEqual(3, machine.memory[9])
+
+    def test_store_into_group_splits_it(self):
+        # the first add patches the second one's operand, so they can't be
+        # read up front
+        block = basic_blocks(Intcode("1101,5,0,5,1101,0,0,11,99,0,0,0"))[0]
+        self.assertEqual([], groups(block))
+
+    def test_overwritten(self):
+        # the add at 0 patches the add at 4 after it's been fused
+        machine = Intcode(
+            "1101,0,5,6,1101,1,1,20,1102,2,3,21,4,20,4,21,99,0,0,0,0,0", 0)
+        fusion = Fusion(machine)
+        self.assertEqual([4], list(fusion.fused))
+        fusion.run()
+        self.assertEqual([6, 6], machine.output)
+        self.assertNotIn(4, fusion.fused)
+
+    def test_day_2_opcodes(self):
+        class Day2(intcode.Intcode):
+            OPCODES = intcode.DAY_2
+
+        machine = Day2("1,0,0,0,2,0,0,0,99")
+        fusion = Fusion(machine)
+        self.assertEqual([0], list(fusion.fused))
+        fusion.run()
+        self.assertEqual(4, machine.memory[0])
+        self.assertEqual({}, Fusion(Day2("1107,1,2,0,1105,1,0,99")).fused)
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    machine = Intcode(source, 5)
+    Fusion(machine).run()
+
+    print(machine.output)
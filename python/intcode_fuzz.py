@@ -0,0 +1,400 @@
+"""
+Check faster Intcode engines against the reference one on random programs
+
+program() generates a random valid program that always halts: it jumps over
+a block of data cells into a loop that runs a random body a few times,
+counting down a cell of its own. The body mixes ADD, MULTIPLY, LESS_THAN,
+EQUALS, INPUT, OUTPUT and forward jumps, in position and immediate mode. Some
+of its stores land on the immediate operands of earlier instructions, and
+some rewrite an earlier instruction into another one (ADD, LESS_THAN and
+EQUALS into each other, one jump into the other) or switch its operands to
+immediate mode, so the program changes itself on every trip around the loop.
+A tenth or so of the data, immediates and inputs don't fit in 64 bits.
+
+Every engine in ENGINES takes (source, inputs) and returns the machine after
+running it. check() runs a corpus through all of them and reports anywhere
+output, memory or status differ from Reference, a plain interpreter kept
+apart from the engine (it's the original day 5 machine) so a bug in the
+shared handlers can't hide by being in both. throughput() times each engine
+over the same corpus, counting instructions by what the reference executed,
+so a faster engine and a correct one are always measured on the same
+programs.
+
+The numpy batch executor isn't registered: its cells stop at 64 bits and it
+only takes one scalar input per machine, so it can't run this corpus.
+"""
+from collections import namedtuple
+import random
+import time
+import unittest
+
+import intcode_memory
+from intcode import Intcode
+from intcode_compiler import Compiler
+from intcode_fusion import Fusion
+
+Mismatch = namedtuple("Mismatch", "engine program field expected actual")
+
+# name -> function(source, inputs) returning the machine it ran
+ENGINES = {}
+
+
+def engine(name):
+    def register(function):
+        ENGINES[name] = function
+        return function
+    return register
+
+
+class Reference:
+    """
+    the original day 5 interpreter: every instruction decoded from scratch,
+    a chain of ifs and a list for memory, sharing no code with the engine
+    """
+
+    def __init__(self, source, inputs):
+        self.memory = list(map(int, source.split(",")))
+        self.original = list(self.memory)
+        self.inputs = list(inputs)
+        self.output = []
+        self.ip = 0
+        self.status = Intcode.RUNNING
+        # instructions executed, not counting HALT, and how many of those had
+        # been rewritten since the program started
+        self.steps = 0
+        self.rewritten = 0
+
+    def param(self, number, modes):
+        value = self.memory[self.ip + number]
+        mode = modes // 10 ** (number - 1) % 10
+        if mode == 0:
+            return self.memory[value]
+        elif mode == 1:
+            return value
+        raise ValueError(f"Invalid mode {mode}")
+
+    def run(self):
+        memory = self.memory
+        while True:
+            raw = memory[self.ip]
+            instruction, modes = raw % 100, raw // 100
+            if instruction == 99:
+                self.status = Intcode.HALTED
+                return self.status
+            elif instruction in (1, 2, 7, 8):
+                param_1 = self.param(1, modes)
+                param_2 = self.param(2, modes)
+                if instruction == 1:
+                    value = param_1 + param_2
+                elif instruction == 2:
+                    value = param_1 * param_2
+                elif instruction == 7:
+                    value = 1 if param_1 < param_2 else 0
+                else:
+                    value = 1 if param_1 == param_2 else 0
+                memory[memory[self.ip + 3]] = value
+                next_ip = self.ip + 4
+            elif instruction == 3:
+                if not self.inputs:
+                    self.status = Intcode.NEEDS_INPUT
+                    return self.status
+                memory[memory[self.ip + 1]] = self.inputs.pop(0)
+                next_ip = self.ip + 2
+            elif instruction == 4:
+                self.output.append(self.param(1, modes))
+                next_ip = self.ip + 2
+            elif instruction in (5, 6):
+                if (self.param(1, modes) != 0) == (instruction == 5):
+                    next_ip = self.param(2, modes)
+                else:
+                    next_ip = self.ip + 3
+            else:
+                raise ValueError(f"Invalid opcode {instruction} at {self.ip}")
+            if raw != self.original[self.ip]:
+                self.rewritten += 1
+            self.steps += 1
+            self.ip = next_ip
+
+
+def reference(source, inputs):
+    machine = Reference(source, inputs)
+    machine.run()
+    return machine
+
+
+@engine("run")
+def run(source, inputs):
+    machine = Intcode(source, list(inputs))
+    machine.run()
+    return machine
+
+
+@engine("run_fast")
+def run_fast(source, inputs):
+    machine = Intcode(source, list(inputs))
+    machine.run_fast()
+    return machine
+
+
+@engine("typed memory")
+def typed(source, inputs):
+    machine = Intcode(source, list(inputs), memory=intcode_memory.typed)
+    machine.run_fast()
+    return machine
+
+
+@engine("paged memory")
+def paged(source, inputs):
+    machine = Intcode(source, list(inputs), memory=intcode_memory.Paged)
+    machine.run()
+    return machine
+
+
+@engine("lazy memory")
+def lazy(source, inputs):
+    machine = Intcode(source, list(inputs), memory=intcode_memory.Lazy)
+    machine.run()
+    return machine
+
+
+@engine("compiler")
+def compiled(source, inputs):
+    machine = Intcode(source, list(inputs))
+    Compiler(machine).run()
+    return machine
+
+
+@engine("fusion")
+def fused(source, inputs):
+    machine = Intcode(source, list(inputs))
+    Fusion(machine).run()
+    return machine
+
+
+def constant(rng, low, high, big):
+    """
+    a random int in [low, high], or with probability big one that doesn't
+    fit in 64 bits
+    """
+    if rng.random() < big:
+        return rng.choice((-1, 1)) * rng.randint(2 ** 63, 2 ** 70)
+    return rng.randint(low, high)
+
+
+def program(rng, data_size=8, body_size=12, max_loops=5, big=0.1):
+    """
+    (source, inputs) for a random program that halts
+    """
+    # jump over the data to the code
+    cells = [1105, 1, 0]
+    data = range(len(cells), len(cells) + data_size)
+    cells.extend(constant(rng, -50, 50, big) for _ in data)
+    counter = len(cells)
+    cells.append(rng.randint(1, max_loops))
+    start = cells[2] = len(cells)
+
+    # addresses of immediate operands that are safe to overwrite
+    immediates = []
+    # address of the first cell of each instruction in the body
+    addresses = []
+    # (address, instruction, modes) of earlier instructions that can be
+    # rewritten into another one of the same width
+    rewritable = []
+    # (cell holding a jump target, index of the instruction it jumps to)
+    jumps = []
+    reads = 0
+
+    def operand(immediate_range=(-20, 20), writable=True):
+        if rng.random() < 0.5:
+            cells.append(rng.choice(data))
+            return 0
+        if writable:
+            immediates.append(len(cells))
+            cells.append(constant(rng, *immediate_range, big))
+        else:
+            cells.append(rng.randint(*immediate_range))
+        return 1
+
+    def rewrite(instruction, modes):
+        # operands only ever go from position to immediate mode: a stored
+        # immediate could be anything, so it's no good as an address
+        modes = [mode | (rng.random() < 0.3) for mode in modes]
+        if instruction in (5, 6):
+            return rng.choice((5, 6)) + 100 * modes[0] + 1000
+        return rng.choice((1, 7, 8)) + 100 * modes[0] + 1000 * modes[1]
+
+    for index in range(body_size):
+        addresses.append(len(cells))
+        kind = rng.choice(("add", "add", "multiply", "less than", "equals",
+                           "input", "output", "jump", "rewrite"))
+        if kind == "rewrite" and not rewritable:
+            kind = "add"
+        if kind == "rewrite":
+            address, instruction, modes = rng.choice(rewritable)
+            cells.extend((1101, rewrite(instruction, modes), 0, address))
+        elif kind == "input":
+            cells.extend((3, rng.choice(data)))
+            reads += 1
+        elif kind == "output":
+            cells.append(0)
+            cells[addresses[-1]] = 4 + 100 * operand()
+        elif kind == "jump":
+            cells.append(0)
+            mode = operand()
+            instruction = rng.choice((5, 6))
+            cells[addresses[-1]] = instruction + 100 * mode + 1000
+            rewritable.append((addresses[-1], instruction, (mode,)))
+            jumps.append((len(cells), rng.randint(index + 1, body_size)))
+            cells.append(0)
+        else:
+            cells.append(0)
+            instruction = {"add": 1, "multiply": 2, "less than": 7,
+                           "equals": 8}[kind]
+            if kind == "multiply":
+                # a small immediate keeps values from exploding
+                mode_1 = operand()
+                mode_2 = operand((-3, 3), writable=False)
+            else:
+                mode_1 = operand()
+                mode_2 = operand()
+                # multiplying isn't one of the rewrites for the same reason
+                rewritable.append(
+                    (addresses[-1], instruction, (mode_1, mode_2)))
+            cells[addresses[-1]] = instruction + 100 * mode_1 + 1000 * mode_2
+            if immediates and rng.random() < 0.2:
+                cells.append(rng.choice(immediates))
+            else:
+                cells.append(rng.choice(data))
+
+    # count down and go round again
+    addresses.append(len(cells))
+    cells.extend((1001, counter, -1, counter, 1005, counter, start, 99))
+    for cell, target in jumps:
+        cells[cell] = addresses[target]
+
+    inputs = [constant(rng, -100, 100, big)
+              for _ in range(reads * max_loops)]
+    return ",".join(map(str, cells)), inputs
+
+
+def corpus(count, seed=0, **kwargs):
+    rng = random.Random(seed)
+    return [program(rng, **kwargs) for _ in range(count)]
+
+
+def check(programs, engines=None):
+    """
+    every Mismatch between the reference and engines (by default, all of
+    them) over programs
+    """
+    engines = engines or ENGINES
+    mismatches = []
+    for index, (source, inputs) in enumerate(programs):
+        expected = reference(source, inputs)
+        for name, function in engines.items():
+            try:
+                machine = function(source, inputs)
+            except Exception as e:
+                mismatches.append(Mismatch(name, index, "error", None, e))
+                continue
+            for field, want, got in (
+                    ("output", expected.output, machine.output),
+                    ("memory", list(expected.memory), list(machine.memory)),
+                    ("status", expected.status, machine.status)):
+                if want != got:
+                    mismatches.append(Mismatch(name, index, field, want, got))
+    return mismatches
+
+
+def throughput(programs, engines=None):
+    """
+    {engine: instructions per second} running every program in programs
+    """
+    engines = engines or ENGINES
+    instructions = sum(reference(*program).steps for program in programs)
+    rates = {}
+    for name, function in engines.items():
+        start = time.perf_counter()
+        for source, inputs in programs:
+            function(source, inputs)
+        rates[name] = instructions / (time.perf_counter() - start)
+    return rates
+
+
+class Test(unittest.TestCase):
+    PROGRAMS = corpus(100)
+
+    def test_programs_halt(self):
+        for source, inputs in self.PROGRAMS:
+            machine = reference(source, inputs)
+            self.assertEqual(Intcode.HALTED, machine.status)
+
+    def test_programs_modify_themselves(self):
+        modified = 0
+        for source, inputs in self.PROGRAMS:
+            machine = reference(source, inputs)
+            code = Intcode(source).memory
+            start = code[2]
+            if machine.memory[start:] != code[start:]:
+                modified += 1
+        self.assertGreater(modified, 10)
+
+    def test_programs_rewrite_instructions(self):
+        rewritten = [reference(source, inputs).rewritten
+                     for source, inputs in self.PROGRAMS]
+        self.assertGreater(sum(count > 0 for count in rewritten), 20)
+
+    def test_programs_go_past_64_bits(self):
+        big = 0
+        for source, inputs in self.PROGRAMS:
+            machine = reference(source, inputs)
+            if any(abs(value) >= 2 ** 63 for value in machine.memory):
+                big += 1
+        self.assertGreater(big, 20)
+
+    def test_reference(self):
+        machine = reference("3,9,8,9,10,9,4,9,99,-1,8", [8])
+        self.assertEqual([1], machine.output)
+        self.assertEqual(3, machine.steps)
+        self.assertEqual(Intcode.HALTED, machine.status)
+        self.assertEqual(Intcode.NEEDS_INPUT, reference("3,0,99", []).status)
+        with self.assertRaises(ValueError):
+            reference("1,0,0,0,98", [])
+        with self.assertRaises(ValueError):
+            reference("204,0,99", [])
+
+    def test_engines_agree(self):
+        self.assertEqual([], check(self.PROGRAMS))
+
+    def test_catches_regression(self):
+        def off_by_one(source, inputs):
+            machine = run_fast(source, inputs)
+            machine.output.append(0)
+            return machine
+
+        def crashes(source, inputs):
+            raise ValueError("nope")
+
+        mismatches = check(self.PROGRAMS[:3], {"off by one": off_by_one,
+                                               "crashes": crashes})
+        self.assertEqual(
+            [("off by one", 0, "output"), ("crashes", 0, "error")],
+            [mismatch[:3] for mismatch in mismatches[:2]])
+        self.assertEqual(6, len(mismatches))
+
+    def test_throughput(self):
+        rates = throughput(self.PROGRAMS[:5])
+        self.assertEqual(set(ENGINES), set(rates))
+        for rate in rates.values():
+            self.assertGreater(rate, 0)
+
+
+if __name__ == "__main__":
+    programs = corpus(500)
+    mismatches = check(programs)
+    for mismatch in mismatches[:10]:
+        print(mismatch)
+    print(f"{len(mismatches)} mismatches over {len(programs)} programs")
+
+    for name, rate in throughput(programs).items():
+        print(f"{name:>15} {rate:12.0f} instructions/s")
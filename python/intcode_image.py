@@ -0,0 +1,170 @@
+"""
+Cache parsed Intcode programs as binary images, keyed by a hash of the source
+
+An image is a header (magic, cell count and the sha256 of the source it was
+parsed from) followed by the cells as little endian 64 bit ints. Images live
+in a cache directory next to the source, named after the hash, so editing the
+source just means the next load parses it again and writes a new image.
+
+load() memory-maps the image and hands back a read-only memoryview of the
+cells without copying them, np.frombuffer can wrap the same buffer. A source
+with a cell that doesn't fit in 64 bits has no image, so it's parsed every
+time and comes back as a tuple. The cache is only an optimisation: if the
+image can't be written (a read-only or missing directory, a full disk), load
+still returns the parsed cells, just not mapped.
+"""
+from array import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import intcode
+
+MAGIC = b"ICIMAGE\x01"
+
+# magic, cell count, sha256 of the source
+HEADER = struct.Struct("<8sq32s")
+
+
+def cache_directory(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)),
+                        ".intcode_cache")
+
+
+def parse(raw):
+    return intcode.parse(raw)
+
+
+def load(path, cache_dir=None):
+    """
+    the cells of the program at path, as a read-only memoryview of int64s,
+    or a tuple if they don't all fit in 64 bits
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).digest()
+
+    cache_dir = cache_dir or cache_directory(path)
+    image = os.path.join(cache_dir, digest.hex() + ".img")
+    cells = _map(image, digest)
+    if cells is None:
+        parsed = parse(raw)
+        if not isinstance(parsed, array):
+            # parse fell back to a list, there's no int64 image of it
+            return tuple(parsed)
+        try:
+            _write(image, digest, parsed)
+        except OSError:
+            pass
+        cells = _map(image, digest)
+        if cells is None:
+            # couldn't be cached, so there's nothing to map
+            return memoryview(parsed).toreadonly()
+    return cells
+
+
+def _map(image, digest):
+    """
+    the cells in image, or None if it's missing or not for this source
+    """
+    try:
+        with open(image, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(mapped) < HEADER.size:
+        mapped.close()
+        return None
+    magic, count, source_digest = HEADER.unpack_from(mapped)
+    if (magic != MAGIC or source_digest != digest
+            or len(mapped) != HEADER.size + count * 8):
+        mapped.close()
+        return None
+
+    cells = memoryview(mapped)[HEADER.size:].cast("q")
+    if sys.byteorder == "big":
+        swapped = array("q", cells)
+        swapped.byteswap()
+        cells = memoryview(swapped).toreadonly()
+    return cells
+
+
+def _write(image, digest, cells):
+    body = array("q", cells)
+    if sys.byteorder == "big":
+        body.byteswap()
+
+    os.makedirs(os.path.dirname(image), exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(image), delete=False) as f:
+        try:
+            f.write(HEADER.pack(MAGIC, len(body), digest))
+            f.write(body.tobytes())
+        except OSError:
+            # don't leave half an image lying around
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, image)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "program.txt")
+
+    def write_source(self, source):
+        with open(self.path, "w") as f:
+            f.write(source)
+
+    def test_load(self):
+        self.write_source("1101,100,-1,4,0\n")
+        cells = load(self.path)
+        self.assertEqual([1101, 100, -1, 4, 0], cells.tolist())
+        self.assertTrue(cells.readonly)
+
+    def test_cached(self):
+        self.write_source("3,0,4,0,99")
+        load(self.path)
+        with mock.patch(__name__ + ".parse") as parse:
+            self.assertEqual([3, 0, 4, 0, 99], load(self.path).tolist())
+        parse.assert_not_called()
+
+    def test_source_changed(self):
+        self.write_source("3,0,4,0,99")
+        load(self.path)
+        self.write_source("4,0,99")
+        self.assertEqual([4, 0, 99], load(self.path).tolist())
+        self.assertEqual(2, len(os.listdir(cache_directory(self.path))))
+
+    def test_too_big(self):
+        self.write_source(f"104,{2 ** 70},99")
+        self.assertEqual((104, 2 ** 70, 99), load(self.path))
+        self.assertFalse(os.path.exists(cache_directory(self.path)))
+
+    def test_unwritable_cache(self):
+        self.write_source("3,0,4,0,99")
+        with mock.patch("os.makedirs", side_effect=PermissionError):
+            cells = load(self.path)
+        self.assertEqual([3, 0, 4, 0, 99], cells.tolist())
+        self.assertTrue(cells.readonly)
+        self.assertFalse(os.path.exists(cache_directory(self.path)))
+
+    def test_corrupt_image(self):
+        self.write_source("3,0,4,0,99")
+        load(self.path)
+        image, = os.listdir(cache_directory(self.path))
+        with open(os.path.join(cache_directory(self.path), image), "r+b") as f:
+            f.truncate(HEADER.size + 8)
+        self.assertEqual([3, 0, 4, 0, 99], load(self.path).tolist())
+
+
+if __name__ == "__main__":
+    print(len(load("inputs/day05.txt")))
@@ -0,0 +1,255 @@
+"""
+Remember what deterministic Intcode runs produced, so running the same
+program on the same input again doesn't have to
+
+A run is keyed by a sha256 of everything that decides how it goes: the opcode
+set (name and version), the ip, every memory cell, and the input. A cached
+result is the output produced by that run, leaving out anything the machine
+output before it, and a sha256 of memory when the program halted.
+
+Results are kept in an in-process LRU of a fixed number of entries, and
+optionally in a directory on disk, one small JSON file per result. The
+directory is trimmed to a size limit after every write, least recently used
+first, so it can be shared between runs (and processes) without growing
+forever.
+
+Only runs that halt are cached. A machine reading from an iterator can't be
+keyed, so it's just run. Anything else can opt out with cache=False. Results
+hold the output, so machines have to output to a list rather than a sink.
+"""
+import collections
+from collections import namedtuple, OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+import intcode
+from intcode import Intcode
+
+Result = namedtuple("Result", "output memory_digest")
+
+
+def digest(memory):
+    return hashlib.sha256(",".join(map(str, memory)).encode()).hexdigest()
+
+
+def key(machine):
+    """
+    the cache key for machine's current state, or None if it can't have one
+    """
+    if machine.source is not None:
+        return None
+    opcodes = machine.OPCODES
+    state = hashlib.sha256()
+    for part in (opcodes.name, opcodes.version, machine.ip,
+                 digest(machine.memory), list(machine.pending),
+                 machine.input):
+        state.update(f"{part}\0".encode())
+    return state.hexdigest()
+
+
+class Memo:
+    def __init__(self, size=128, directory=None, max_bytes=16 * 1024 * 1024):
+        """
+        size is how many results to keep in memory. with a directory, results
+        are also kept there, up to max_bytes of them
+        """
+        self.size = size
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # key -> Result, least recently used first
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, machine, cache=True):
+        """
+        the Result of running machine until it halts. its output is just
+        what this run produced, not what's already in machine.output
+
+        on a hit machine isn't run at all, so only the Result says how it
+        would have ended
+        """
+        if not isinstance(machine.output, list):
+            raise ValueError("memo needs machines that output to a list")
+        run_key = key(machine) if cache else None
+        if run_key is not None:
+            result = self.get(run_key)
+            if result is not None:
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        before = len(machine.output)
+        machine.run()
+        result = Result(machine.output[before:], digest(machine.memory))
+        if run_key is not None and machine.status == Intcode.HALTED:
+            self.put(run_key, result)
+        return result
+
+    def get(self, run_key):
+        result = self.results.get(run_key)
+        if result is not None:
+            self.results.move_to_end(run_key)
+            return result
+        if self.directory is None:
+            return None
+
+        path = os.path.join(self.directory, run_key + ".json")
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            # reads count as use, so eviction is least recently used
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        result = Result(saved["output"], saved["memory_digest"])
+        self.remember(run_key, result)
+        return result
+
+    def put(self, run_key, result):
+        self.remember(run_key, result)
+        if self.directory is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                "w", dir=self.directory, delete=False) as f:
+            json.dump(result._asdict(), f)
+        os.replace(f.name, os.path.join(self.directory, run_key + ".json"))
+        self.evict()
+
+    def remember(self, run_key, result):
+        self.results[run_key] = result
+        self.results.move_to_end(run_key)
+        while len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+    def evict(self):
+        """
+        delete the least recently used results on disk until they fit in
+        max_bytes
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class Test(unittest.TestCase):
+    # add up inputs until one is 0, then output the total
+    TOTAL = "3,15,1006,15,12,1,15,16,16,1105,1,0,4,16,99,0,0"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_hit(self):
+        memo = Memo()
+        first = memo.run(Intcode(self.TOTAL, [1, 2, 0]))
+        self.assertEqual([3], first.output)
+
+        machine = Intcode(self.TOTAL, [1, 2, 0])
+        self.assertEqual(first, memo.run(machine))
+        self.assertEqual(0, machine.ip)
+        self.assertEqual((1, 1), (memo.hits, memo.misses))
+
+    def test_key(self):
+        machine = Intcode(self.TOTAL, [1, 2, 0])
+        self.assertEqual(key(machine), key(Intcode(self.TOTAL, [1, 2, 0])))
+        self.assertNotEqual(key(machine), key(Intcode(self.TOTAL, [2, 1, 0])))
+        self.assertNotEqual(key(machine), key(Intcode(self.TOTAL, 1)))
+        machine.memory[16] = 5
+        self.assertNotEqual(key(machine), key(Intcode(self.TOTAL, [1, 2, 0])))
+
+        class Other(Intcode):
+            OPCODES = intcode.OpcodeSet("other", 1, intcode.DAY_5_2.opcodes)
+
+        self.assertNotEqual(
+            key(Other(self.TOTAL, [1, 2, 0])),
+            key(Intcode(self.TOTAL, [1, 2, 0])))
+
+    def test_earlier_output(self):
+        memo = Memo()
+        results = []
+        for earlier in (1, 2):
+            # the same state, after outputting different things
+            machine = Intcode(self.TOTAL, [5, 0])
+            machine.output.append(earlier)
+            results.append(memo.run(machine))
+        self.assertEqual([Result([5], results[0].memory_digest)] * 2,
+                         results)
+        self.assertEqual(1, memo.hits)
+
+    def test_memory_digest(self):
+        machine = Intcode(self.TOTAL, [1, 2, 0])
+        result = Memo().run(machine)
+        self.assertEqual(digest(machine.memory), result.memory_digest)
+
+    def test_lru(self):
+        memo = Memo(size=2)
+        for total in (1, 2, 3):
+            memo.run(Intcode(self.TOTAL, [total, 0]))
+        self.assertEqual(2, len(memo.results))
+        memo.run(Intcode(self.TOTAL, [1, 0]))
+        self.assertEqual(0, memo.hits)
+
+    def test_opt_out(self):
+        memo = Memo()
+        memo.run(Intcode(self.TOTAL, [1, 0]), cache=False)
+        memo.run(Intcode(self.TOTAL, [1, 0]), cache=False)
+        self.assertEqual({}, memo.results)
+        memo.run(Intcode("3,0,99", iter([1])))
+        self.assertEqual({}, memo.results)
+
+    def test_output_sink(self):
+        machine = Intcode(self.TOTAL, [1, 0], output=collections.deque())
+        with self.assertRaises(ValueError):
+            Memo().run(machine)
+
+    def test_needs_input_not_cached(self):
+        memo = Memo()
+        result = memo.run(Intcode(self.TOTAL, [1]))
+        self.assertEqual([], result.output)
+        self.assertEqual({}, memo.results)
+
+    def test_disk(self):
+        Memo(directory=self.directory).run(Intcode(self.TOTAL, [4, 0]))
+        memo = Memo(directory=self.directory)
+        self.assertEqual([4], memo.run(Intcode(self.TOTAL, [4, 0])).output)
+        self.assertEqual(1, memo.hits)
+
+    def test_disk_eviction(self):
+        memo = Memo(directory=self.directory, max_bytes=1)
+        memo.run(Intcode(self.TOTAL, [4, 0]))
+        memo.run(Intcode(self.TOTAL, [5, 0]))
+        self.assertEqual(0, len(os.listdir(self.directory)))
+
+        memo = Memo(directory=self.directory, max_bytes=200)
+        for total in range(5):
+            memo.run(Intcode(self.TOTAL, [total, 0]))
+        sizes = [entry.stat().st_size for entry in os.scandir(self.directory)]
+        self.assertLessEqual(sum(sizes), 200)
+        self.assertGreater(len(sizes), 0)
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    memo = Memo(directory=os.path.join("inputs", ".intcode_cache"))
+    for _ in range(2):
+        print(memo.run(Intcode(source, 5)).output, memo.hits, memo.misses)
@@ -0,0 +1,246 @@
+"""
+Memory backends for Intcode
+
+A backend is called with the parsed cells and returns something that acts
+enough like a list: indexing, slicing, assignment and len
+"""
+from array import array
+from bisect import bisect_right
+import mmap
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+def typed(cells):
+    """
+    pack cells into an array of 64 bit ints, about a fifth of the size of a
+    list of ints. falls back to a list if a cell doesn't fit
+
+    storing something too big for the array raises OverflowError, which
+    Intcode catches to swap the array for a list
+    """
+    if isinstance(cells, memoryview) and cells.format == "q":
+        # a straight copy of the buffer, not a python int per cell
+        packed = array("q")
+        packed.frombytes(cells.cast("B"))
+        return packed
+    try:
+        return array("q", cells)
+    except OverflowError:
+        return list(cells)
+
+
+class Paged:
+    """
+    sparse memory, in PAGE_SIZE cell pages that are only allocated when
+    something is written to them. reading a cell that was never written gives
+    0, so programs can use addresses way past their own end and only pay for
+    the pages they touch
+
+    unlike a list, negative addresses are an IndexError rather than counting
+    back from the end
+    """
+    PAGE_SIZE = 1024
+
+    def __init__(self, cells=()):
+        # page number -> list of PAGE_SIZE cells
+        self.pages = {}
+        cells = list(cells)
+        for start in range(0, len(cells), self.PAGE_SIZE):
+            page = cells[start:start + self.PAGE_SIZE]
+            page.extend([0] * (self.PAGE_SIZE - len(page)))
+            self.pages[start // self.PAGE_SIZE] = page
+        self.length = len(cells)
+
+    def __getitem__(self, addr):
+        if isinstance(addr, slice):
+            start, stop, stride = addr.indices(max(len(self), addr.stop or 0))
+            return [self[a] for a in range(start, stop, stride)]
+        if addr < 0:
+            raise IndexError(f"negative address {addr}")
+        page = self.pages.get(addr // self.PAGE_SIZE)
+        if page is None:
+            return 0
+        return page[addr % self.PAGE_SIZE]
+
+    def __setitem__(self, addr, value):
+        if addr < 0:
+            raise IndexError(f"negative address {addr}")
+        number, offset = divmod(addr, self.PAGE_SIZE)
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = [0] * self.PAGE_SIZE
+        page[offset] = value
+        if addr >= self.length:
+            self.length = addr + 1
+
+    def __len__(self):
+        """
+        one past the highest address written, or the program length
+        """
+        return self.length
+
+    def __iter__(self):
+        for addr in range(len(self)):
+            yield self[addr]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    __hash__ = None
+
+
+class Lazy:
+    """
+    memory that parses the program as it's used, rather than all up front
+
+    the source is split into chunks of about CHUNK_BYTES, each ending just
+    after a comma, and counting the commas in each finds the address of its
+    first cell. that's the only pass over the whole source. a chunk is parsed
+    the first time one of its cells is read or written, so a run that only
+    touches a small part of a huge program only pays for that part
+
+    the source can be str, bytes or an mmap of the file. Intcode hands it over
+    unparsed because PARSES is set. like Paged, negative addresses are an
+    IndexError
+    """
+    CHUNK_BYTES = 4096
+    PARSES = True
+
+    def __init__(self, source):
+        if isinstance(source, str):
+            source = source.encode()
+        elif not isinstance(source, (bytes, bytearray, mmap.mmap)):
+            # already parsed cells
+            source = ",".join(map(str, source)).encode()
+        self.source = source
+
+        # byte offset each chunk starts at, and the address of its first cell
+        self.starts = [0]
+        self.firsts = [0]
+        size = len(source)
+        while True:
+            comma = source.find(b",", self.starts[-1] + self.CHUNK_BYTES)
+            if comma == -1:
+                break
+            # mmap has no count(), so count a copy of just this chunk
+            commas = source[self.starts[-1]:comma + 1].count(b",")
+            self.firsts.append(self.firsts[-1] + commas)
+            self.starts.append(comma + 1)
+        commas = source[self.starts[-1]:].count(b",")
+        self.length = self.firsts[-1] + commas + 1
+        # the end of the last chunk, as if there was a comma after the source
+        self.starts.append(size + 1)
+        # chunk number -> its cells
+        self.chunks = {}
+
+    def chunk(self, addr):
+        """
+        the cells of the chunk addr is in, and where addr is in it
+        """
+        if addr < 0:
+            raise IndexError(f"negative address {addr}")
+        if addr >= self.length:
+            raise IndexError(f"address {addr} past the end of memory")
+        number = bisect_right(self.firsts, addr) - 1
+        cells = self.chunks.get(number)
+        if cells is None:
+            raw = self.source[self.starts[number]:self.starts[number + 1] - 1]
+            cells = self.chunks[number] = list(map(int, raw.split(b",")))
+        return cells, addr - self.firsts[number]
+
+    def __getitem__(self, addr):
+        if isinstance(addr, slice):
+            return [self[a] for a in range(*addr.indices(len(self)))]
+        cells, offset = self.chunk(addr)
+        return cells[offset]
+
+    def __setitem__(self, addr, value):
+        cells, offset = self.chunk(addr)
+        cells[offset] = value
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for addr in range(len(self)):
+            yield self[addr]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    __hash__ = None
+
+
+class Test(unittest.TestCase):
+    def test_typed(self):
+        self.assertEqual(array("q", [1, -2, 3]), typed([1, -2, 3]))
+
+    def test_typed_buffer(self):
+        cells = memoryview(array("q", [1, -2, 3])).toreadonly()
+        self.assertEqual(array("q", [1, -2, 3]), typed(cells))
+
+    def test_typed_too_big(self):
+        self.assertEqual([1, 2 ** 63], typed([1, 2 ** 63]))
+
+    def test_paged(self):
+        memory = Paged([1, 2, 3])
+        self.assertEqual([1, 2, 3], memory)
+        self.assertEqual(0, memory[10 ** 12])
+        self.assertEqual(3, len(memory))
+        self.assertEqual(1, len(memory.pages))
+
+        memory[10 ** 12] = 4
+        self.assertEqual(4, memory[10 ** 12])
+        self.assertEqual(10 ** 12 + 1, len(memory))
+        self.assertEqual(2, len(memory.pages))
+
+    def test_paged_slice(self):
+        memory = Paged(range(2000))
+        self.assertEqual([1022, 1023, 1024, 1025], memory[1022:1026])
+        self.assertEqual([1999, 0], memory[1999:2001])
+
+    def test_lazy(self):
+        source = ",".join(str(-i) for i in range(5000)) + "\n"
+        memory = Lazy(source)
+        self.assertEqual(5000, len(memory))
+        self.assertEqual({}, memory.chunks)
+        self.assertEqual(-4321, memory[4321])
+        self.assertEqual(1, len(memory.chunks))
+        self.assertEqual(-4999, memory[4999])
+        self.assertEqual(list(map(int, source.split(","))), memory)
+
+    def test_lazy_write(self):
+        memory = Lazy(b"1,2,3")
+        memory[2] = 2 ** 70
+        self.assertEqual([1, 2, 2 ** 70], memory)
+        self.assertEqual([2, 2 ** 70], memory[1:3])
+        with self.assertRaises(IndexError):
+            memory[3]
+        with self.assertRaises(IndexError):
+            memory[-1] = 0
+
+    def test_lazy_chunks(self):
+        for size in (1, 2, 3, 7):
+            with mock.patch.object(Lazy, "CHUNK_BYTES", size):
+                memory = Lazy("10,-200,3000,4,50")
+                self.assertEqual([10, -200, 3000, 4, 50], memory)
+
+    def test_lazy_mmap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.txt")
+            with open(path, "w") as f:
+                f.write("3,0,4,0,99\n")
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    memory = Lazy(m)
+                    self.assertEqual(99, memory[4])
+                    self.assertEqual(5, len(memory))
+
+    def test_paged_negative(self):
+        with self.assertRaises(IndexError):
+            Paged([1])[-1]
+        with self.assertRaises(IndexError):
+            Paged([1])[-1] = 2
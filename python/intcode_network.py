@@ -0,0 +1,232 @@
+"""
+Run networks of Intcode machines on a single asyncio event loop
+
+Every machine gets a bounded asyncio.Queue as its inbox, and its outputs are
+copied into the inbox of every machine it's connected to. A machine runs for
+at most slice_size instructions before letting the others have a go, waits on
+its inbox when it needs input, and waits for room in a full inbox downstream
+before sending more. Anything sent to a machine that has halted is dropped.
+If every machine that hasn't halted is either waiting for input on an empty
+inbox or waiting to send to a full one, nothing can ever happen again and run
+raises Deadlock
+"""
+import asyncio
+import unittest
+
+import intcode_sinks
+from intcode import Intcode
+
+
+class Deadlock(Exception):
+    pass
+
+
+class Network:
+    def __init__(self, slice_size=1000, queue_size=64):
+        self.slice_size = slice_size
+        self.queue_size = queue_size
+        self.machines = {}
+        # name -> names of the machines its outputs go to
+        self.edges = {}
+
+    def add(self, name, machine):
+        """
+        machine has to output to a list, which is where values are sent from
+        """
+        if not isinstance(machine.output, list):
+            raise ValueError("network machines need to output to a list")
+        self.machines[name] = machine
+        self.edges[name] = []
+        return machine
+
+    def connect(self, source, destination):
+        self.edges[source].append(destination)
+
+    async def run(self):
+        """
+        run every machine until they've all halted
+        """
+        self.inboxes = {name: asyncio.Queue(self.queue_size)
+                        for name in self.machines}
+        # name -> event set whenever its inbox has had values taken out
+        self.room = {name: asyncio.Event() for name in self.machines}
+        self.halted = set()
+        # names waiting for input, and name -> machine it's waiting to send to
+        self.waiting = set()
+        self.sending = {}
+        # done once every machine has halted, or with Deadlock once they
+        # can't
+        self.deadlock = asyncio.get_running_loop().create_future()
+
+        tasks = [asyncio.ensure_future(self.drive(name))
+                 for name in self.machines]
+        # in case there's nothing to run
+        self.check_deadlock()
+        await asyncio.wait([*tasks, self.deadlock],
+                           return_when=asyncio.FIRST_EXCEPTION)
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if self.deadlock.done() and self.deadlock.exception():
+            raise self.deadlock.exception()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def drive(self, name):
+        machine = self.machines[name]
+        inbox = self.inboxes[name]
+        sent = len(machine.output)
+
+        while True:
+            machine.run(max_steps=self.slice_size)
+
+            for value in machine.output[sent:]:
+                for other in self.edges[name]:
+                    await self.send(name, other, value)
+            sent = len(machine.output)
+
+            if machine.status == Intcode.HALTED:
+                self.halted.add(name)
+                # let anyone waiting to send here carry on, and drop it
+                self.room[name].set()
+                self.check_deadlock()
+                return
+            elif machine.status == Intcode.NEEDS_INPUT:
+                if inbox.empty():
+                    self.waiting.add(name)
+                    self.check_deadlock()
+                    try:
+                        machine.feed(await inbox.get())
+                    finally:
+                        self.waiting.discard(name)
+                while not inbox.empty():
+                    machine.feed(inbox.get_nowait())
+                self.room[name].set()
+            else:
+                await asyncio.sleep(0)
+
+    async def send(self, name, destination, value):
+        """
+        put value in destination's inbox, waiting for room if it's full
+        """
+        inbox = self.inboxes[destination]
+        room = self.room[destination]
+        while destination not in self.halted:
+            if not inbox.full():
+                inbox.put_nowait(value)
+                return
+            room.clear()
+            self.sending[name] = destination
+            self.check_deadlock()
+            try:
+                await room.wait()
+            finally:
+                del self.sending[name]
+
+    def stuck(self, name):
+        """
+        whether name can't do anything until some other machine does
+        """
+        if name in self.waiting:
+            return self.inboxes[name].empty()
+        if name in self.sending:
+            return self.inboxes[self.sending[name]].full()
+        return False
+
+    def check_deadlock(self):
+        if self.deadlock.done():
+            return
+        alive = [name for name in self.machines if name not in self.halted]
+        if not alive:
+            self.deadlock.set_result(None)
+        elif all(map(self.stuck, alive)):
+            stuck = [f"{name} waiting for input" for name in alive
+                     if name in self.waiting]
+            stuck += [f"{name} waiting to send to {self.sending[name]}"
+                      for name in alive if name in self.sending]
+            self.deadlock.set_exception(Deadlock(", ".join(stuck)))
+
+
+class Test(unittest.TestCase):
+    # read a value, output it plus one, halt
+    INCREMENT = "3,9,1001,9,1,9,4,9,99,0"
+    # the same, but keep going until the output reaches 10
+    LOOP_TO_10 = "3,20,1001,20,1,20,4,20,1007,20,10,21,1005,21,0,99" + ",0" * 6
+
+    def test_chain(self):
+        network = Network()
+        for i in range(1000):
+            network.add(i, Intcode(self.INCREMENT))
+            if i:
+                network.connect(i - 1, i)
+        network.machines[0].feed(0)
+        asyncio.run(network.run())
+        self.assertEqual([1000], network.machines[999].output)
+
+    def test_feedback_loop(self):
+        network = Network(slice_size=3, queue_size=1)
+        a = network.add("a", Intcode(self.LOOP_TO_10, [0]))
+        b = network.add("b", Intcode(self.LOOP_TO_10))
+        network.connect("a", "b")
+        network.connect("b", "a")
+        asyncio.run(network.run())
+        self.assertEqual([1, 3, 5, 7, 9, 11], a.output)
+        self.assertEqual([2, 4, 6, 8, 10], b.output)
+
+    def test_deadlock(self):
+        network = Network()
+        network.add("a", Intcode(self.INCREMENT))
+        network.add("b", Intcode(self.INCREMENT))
+        network.connect("a", "b")
+        network.connect("b", "a")
+        with self.assertRaises(Deadlock):
+            asyncio.run(network.run())
+
+    def test_send_to_halted(self):
+        # the consumer halts after one value, with the rest still coming
+        network = Network(queue_size=2)
+        network.add("producer", Intcode("104,1,104,2,104,3,104,4,104,5,99"))
+        consumer = network.add("consumer", Intcode(self.INCREMENT))
+        network.connect("producer", "consumer")
+        asyncio.run(network.run())
+        self.assertEqual([2], consumer.output)
+
+    def test_deadlock_sending(self):
+        # each one fills the other's inbox before reading its own
+        flood = "104,1,104,2,104,3,3,0,99"
+        network = Network(queue_size=1)
+        network.add("a", Intcode(flood))
+        network.add("b", Intcode(flood))
+        network.connect("a", "b")
+        network.connect("b", "a")
+        with self.assertRaisesRegex(Deadlock, "a waiting to send to b"):
+            asyncio.run(network.run())
+
+    def test_output_sink(self):
+        with self.assertRaises(ValueError):
+            Network().add("a", Intcode(self.INCREMENT,
+                                       output=intcode_sinks.Count()))
+
+    def test_empty(self):
+        asyncio.run(Network().run())
+
+    def test_error_stops_network(self):
+        network = Network()
+        network.add("a", Intcode(self.INCREMENT))
+        network.add("b", Intcode("98"))
+        with self.assertRaises(ValueError):
+            asyncio.run(network.run())
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    network = Network()
+    for value in (1, 5):
+        network.add(value, Intcode(source, value))
+    asyncio.run(network.run())
+
+    for value, machine in network.machines.items():
+        print(value, machine.output)
@@ -0,0 +1,178 @@
+"""
+Profile where an Intcode program spends its time
+
+Profile.run drives a machine one step() at a time, counting and timing every
+instruction by address and opcode. Intcode.run doesn't know about any of
+this, so it costs nothing when it's not being used.
+
+Results come out as JSON, or as collapsed stacks (one "frame;frame weight"
+line per address) that flamegraph.pl and speedscope read directly
+"""
+from collections import Counter
+import json
+import time
+import unittest
+
+import intcode
+import intcode_sinks
+from intcode import Intcode
+
+
+def name(instruction):
+    """
+    what the registered opcode sets call instruction
+    """
+    if instruction == Intcode.HALT:
+        return "HALT"
+    for opcode_set in intcode.OPCODE_SETS.values():
+        if instruction in opcode_set.opcodes:
+            return opcode_set.opcodes[instruction].name
+    return str(instruction)
+
+
+class Profile:
+    def __init__(self):
+        # (ip, instruction) -> times executed
+        self.counts = Counter()
+        # (ip, instruction) -> seconds spent
+        self.seconds = Counter()
+
+    def run(self, machine):
+        """
+        same as machine.run(), recording every instruction it executes
+        """
+        counts = self.counts
+        seconds = self.seconds
+        decode = machine.decode
+        clock = time.perf_counter
+        machine.status = machine.RUNNING
+        while True:
+            ip = machine.ip
+            instruction, _ = decode(machine.memory[ip])
+            start = clock()
+            result = machine.step()
+            elapsed = clock() - start
+            if machine.status in (machine.NEEDS_INPUT, machine.OUTPUT_FULL):
+                # nothing was executed, it's tried again next run
+                break
+            counts[ip, instruction] += 1
+            seconds[ip, instruction] += elapsed
+            if result is None:
+                break
+            machine.ip = result
+        return machine.status
+
+    def opcodes(self):
+        """
+        {instruction: (times executed, seconds spent)}
+        """
+        totals = {}
+        for (ip, instruction), count in self.counts.items():
+            executed, spent = totals.get(instruction, (0, 0.0))
+            totals[instruction] = (
+                executed + count, spent + self.seconds[ip, instruction])
+        return totals
+
+    def addresses(self):
+        """
+        Counter of ip -> instructions executed there
+        """
+        totals = Counter()
+        for (ip, _), count in self.counts.items():
+            totals[ip] += count
+        return totals
+
+    def to_json(self):
+        return json.dumps({
+            "opcodes": {
+                name(instruction): {"count": count, "seconds": spent}
+                for instruction, (count, spent) in self.opcodes().items()
+            },
+            "addresses": {
+                str(ip): count
+                for ip, count in self.addresses().most_common()
+            },
+        }, indent=2)
+
+    def collapsed(self, weight="time"):
+        """
+        one line per (opcode, address), weighted by microseconds spent or,
+        with weight="count", by times executed
+        """
+        lines = []
+        for (ip, instruction), count in sorted(self.counts.items()):
+            if weight == "count":
+                value = count
+            else:
+                value = max(1, round(self.seconds[ip, instruction] * 1e6))
+            lines.append(f"intcode;{name(instruction)};ip {ip} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Test(unittest.TestCase):
+    # count down from 3, outputting each number
+    COUNTDOWN = "1101,0,3,14,4,14,1001,14,-1,14,1005,14,4,99,0"
+
+    def profile(self, source, inputs=()):
+        machine = Intcode(source, inputs)
+        profile = Profile()
+        profile.run(machine)
+        return machine, profile
+
+    def test_run(self):
+        machine, _ = self.profile(self.COUNTDOWN)
+        self.assertEqual([3, 2, 1], machine.output)
+        self.assertEqual(Intcode.HALTED, machine.status)
+
+    def test_counts(self):
+        _, profile = self.profile(self.COUNTDOWN)
+        opcodes = profile.opcodes()
+        self.assertEqual(4, opcodes[Intcode.ADD][0])
+        self.assertEqual(3, opcodes[Intcode.OUTPUT][0])
+        self.assertEqual(3, opcodes[Intcode.JUMP_IF_TRUE][0])
+        self.assertEqual(1, opcodes[Intcode.HALT][0])
+        self.assertEqual(
+            [(4, 3), (6, 3), (10, 3), (0, 1), (13, 1)],
+            profile.addresses().most_common())
+
+    def test_needs_input(self):
+        machine, profile = self.profile("3,0,4,0,99")
+        self.assertEqual(Intcode.NEEDS_INPUT, machine.status)
+        self.assertEqual(Counter(), profile.counts)
+
+        machine.feed(5)
+        profile.run(machine)
+        self.assertEqual([5], machine.output)
+        self.assertEqual(3, sum(profile.counts.values()))
+
+    def test_output_full(self):
+        sink = intcode_sinks.Bounded(1)
+        machine = Intcode(self.COUNTDOWN, output=sink)
+        profile = Profile()
+        while profile.run(machine) == Intcode.OUTPUT_FULL:
+            sink.drain()
+        self.assertEqual(3, profile.opcodes()[Intcode.OUTPUT][0])
+
+    def test_to_json(self):
+        _, profile = self.profile(self.COUNTDOWN)
+        report = json.loads(profile.to_json())
+        self.assertEqual(3, report["opcodes"]["OUTPUT"]["count"])
+        self.assertEqual(3, report["addresses"]["4"])
+
+    def test_collapsed(self):
+        _, profile = self.profile(self.COUNTDOWN)
+        lines = profile.collapsed(weight="count").splitlines()
+        self.assertEqual("intcode;ADD;ip 0 1", lines[0])
+        self.assertIn("intcode;OUTPUT;ip 4 3", lines)
+        for line in profile.collapsed().splitlines():
+            self.assertGreater(int(line.rsplit(" ", 1)[1]), 0)
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    profile = Profile()
+    profile.run(Intcode(source, 5))
+
+    print(profile.to_json())
@@ -0,0 +1,244 @@
+"""
+Run lots of Intcode machines in one thread, sharing instructions fairly
+
+Every turn each runnable machine gets run(max_steps=slice_size * weight), so
+a machine stuck in a loop only ever holds things up for its own slice and the
+rest keep going. Machines waiting for input are set aside until they're fed
+(or, reading from a queue, until it has something in it, or from an
+iterator, until the next run() or a turn where something else ran), and
+machines whose output sink is full until drained() is called or run()
+is called again. Machines that halt, or raise anything (an invalid
+instruction, an address outside memory, a value too big for a sink), are
+dropped, with what they raised kept in errors.
+
+Instructions executed and time spent are kept per machine, which is where
+rates() gets instructions per second from.
+"""
+from collections import Counter, deque
+import queue
+import time
+import unittest
+
+import intcode_sinks
+from intcode import Intcode
+
+
+class Scheduler:
+    def __init__(self, slice_size=1000):
+        self.slice_size = slice_size
+        self.machines = {}
+        self.weights = {}
+        # names of the machines that can run, in the order they get to
+        self.ready = deque()
+        # names of the machines waiting for input
+        self.blocked = set()
+        # names of the machines waiting for room in their output sink
+        self.full = set()
+        # name -> instructions executed, seconds spent running
+        self.steps = Counter()
+        self.seconds = Counter()
+        # name -> exception it stopped with
+        self.errors = {}
+
+    def add(self, name, machine, weight=1):
+        """
+        weight is how many slices machine gets per turn
+        """
+        self.machines[name] = machine
+        self.weights[name] = weight
+        self.ready.append(name)
+        return machine
+
+    def feed(self, name, *values):
+        self.machines[name].feed(*values)
+        if name in self.blocked:
+            self.blocked.remove(name)
+            self.ready.append(name)
+
+    def drained(self, name):
+        """
+        say there's room in name's output sink again
+        """
+        if name in self.full:
+            self.full.remove(name)
+            self.ready.append(name)
+
+    def run(self, turns=None):
+        """
+        give every runnable machine a slice per turn, until nothing can run
+        or turns have gone by. returns the names of the machines still
+        waiting for input or for room for their output
+        """
+        # sinks may have been drained since the last run
+        for name in list(self.full):
+            self.drained(name)
+        ready = self.ready
+        clock = time.perf_counter
+        turn = 0
+        while turns is None or turn < turns:
+            # only retry iterators if something else is going to run, or
+            # this run would never end
+            self.unblock(iterators=turn == 0 or bool(ready))
+            if not ready:
+                break
+            for _ in range(len(ready)):
+                name = ready.popleft()
+                machine = self.machines[name]
+                before = machine.steps
+                start = clock()
+                try:
+                    status = machine.run(
+                        max_steps=self.slice_size * self.weights[name])
+                except Exception as e:
+                    self.errors[name] = e
+                    continue
+                finally:
+                    self.seconds[name] += clock() - start
+                    self.steps[name] += machine.steps - before
+
+                if status == Intcode.RUNNING:
+                    ready.append(name)
+                elif status == Intcode.NEEDS_INPUT:
+                    self.blocked.add(name)
+                elif status == Intcode.OUTPUT_FULL:
+                    self.full.add(name)
+            turn += 1
+        return self.blocked | self.full
+
+    def unblock(self, iterators=False):
+        """
+        move machines that have been fed directly, or whose input queue has
+        something in it, back to ready. there's no telling whether an
+        iterator has anything without reading it, so machines reading one
+        are only moved back if iterators is True
+        """
+        for name in list(self.blocked):
+            machine = self.machines[name]
+            source = machine.source
+            if isinstance(source, queue.Queue):
+                fed = not source.empty()
+            else:
+                fed = iterators and source is not None
+            if machine.pending or fed:
+                self.blocked.remove(name)
+                self.ready.append(name)
+
+    def rates(self):
+        """
+        {name: instructions executed per second of running}
+        """
+        return {name: self.steps[name] / seconds
+                for name, seconds in self.seconds.items() if seconds > 0}
+
+
+class Test(unittest.TestCase):
+    # jump to itself forever
+    FOREVER = "1105,1,0"
+    # count down from 3, outputting each number
+    COUNTDOWN = "1101,0,3,14,4,14,1001,14,-1,14,1005,14,4,99,0"
+
+    def test_runaway_doesnt_starve(self):
+        scheduler = Scheduler(slice_size=5)
+        scheduler.add("forever", Intcode(self.FOREVER))
+        countdowns = [scheduler.add(i, Intcode(self.COUNTDOWN))
+                      for i in range(1000)]
+        scheduler.run(turns=3)
+        for machine in countdowns:
+            self.assertEqual([3, 2, 1], machine.output)
+        self.assertEqual(["forever"], list(scheduler.ready))
+        self.assertEqual(15, scheduler.steps["forever"])
+
+    def test_weights(self):
+        scheduler = Scheduler(slice_size=2)
+        scheduler.add("light", Intcode(self.FOREVER))
+        scheduler.add("heavy", Intcode(self.FOREVER), weight=3)
+        scheduler.run(turns=4)
+        self.assertEqual(8, scheduler.steps["light"])
+        self.assertEqual(24, scheduler.steps["heavy"])
+
+    def test_blocked_until_fed(self):
+        scheduler = Scheduler()
+        machine = scheduler.add("echo", Intcode("3,0,4,0,99"))
+        self.assertEqual({"echo"}, scheduler.run())
+        scheduler.feed("echo", 7)
+        self.assertEqual(set(), scheduler.run())
+        self.assertEqual([7], machine.output)
+
+        machine = scheduler.add("direct", Intcode("3,0,4,0,99"))
+        scheduler.run()
+        machine.feed(8)
+        scheduler.run()
+        self.assertEqual([8], machine.output)
+
+    def test_queue_input(self):
+        scheduler = Scheduler()
+        inputs = queue.Queue()
+        machine = scheduler.add("q", Intcode("3,0,4,0,99", inputs))
+        self.assertEqual({"q"}, scheduler.run())
+        inputs.put(7)
+        self.assertEqual(set(), scheduler.run())
+        self.assertEqual([7], machine.output)
+
+    def test_iterator_input(self):
+        # the other machine's outputs, and None until there's one
+        outputs = []
+
+        def values():
+            while True:
+                yield outputs.pop(0) if outputs else None
+
+        scheduler = Scheduler(slice_size=1)
+        machine = scheduler.add("reader", Intcode("3,0,4,0,99", values()))
+        scheduler.add("writer", Intcode("1101,0,0,0,104,9,99",
+                                        output=intcode_sinks.Callback(
+                                            outputs.append)))
+        self.assertEqual(set(), scheduler.run())
+        self.assertEqual([9], machine.output)
+
+    def test_output_full(self):
+        scheduler = Scheduler()
+        sink = intcode_sinks.Bounded(2)
+        scheduler.add("countdown", Intcode(self.COUNTDOWN, output=sink))
+        self.assertEqual({"countdown"}, scheduler.run())
+        self.assertEqual([3, 2], sink.drain())
+        self.assertEqual(set(), scheduler.run())
+        self.assertEqual([1], sink.drain())
+
+        sink = intcode_sinks.Bounded(1)
+        scheduler.add("fed", Intcode(self.COUNTDOWN, output=sink))
+        scheduler.run()
+        sink.drain()
+        scheduler.drained("fed")
+        scheduler.run(turns=1)
+        self.assertEqual([2], sink.drain())
+
+    def test_errors(self):
+        scheduler = Scheduler()
+        scheduler.add("bad", Intcode("98"))
+        scheduler.add("outside", Intcode("4,1000,99"))
+        good = scheduler.add("good", Intcode(self.COUNTDOWN))
+        scheduler.run()
+        self.assertIsInstance(scheduler.errors["bad"], ValueError)
+        self.assertIsInstance(scheduler.errors["outside"], IndexError)
+        self.assertEqual([3, 2, 1], good.output)
+        self.assertEqual(set(), scheduler.run())
+
+    def test_rates(self):
+        scheduler = Scheduler(slice_size=100)
+        scheduler.add("forever", Intcode(self.FOREVER))
+        scheduler.run(turns=2)
+        self.assertEqual(["forever"], list(scheduler.rates()))
+        self.assertGreater(scheduler.rates()["forever"], 0)
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    scheduler = Scheduler()
+    for value in (1, 5):
+        scheduler.add(value, Intcode(source, value))
+    scheduler.run()
+
+    for value, rate in scheduler.rates().items():
+        print(value, scheduler.machines[value].output, f"{rate:.0f}/s")
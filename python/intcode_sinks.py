@@ -0,0 +1,231 @@
+"""
+Output sinks for Intcode, for when a list of every output is too much
+
+A sink is anything with an append, passed to Intcode as output. Intcode
+appends to it for every OUTPUT and never reads it back. The default is still
+a new list per machine. The network, snapshots and memo read machine.output
+afterwards, so they refuse machines with any other sink, and a trace can
+only rewind past an OUTPUT when it can pop it back off a list.
+
+A sink that can't take a value raises intcode.OutputFull from append. The
+machine stops on that OUTPUT with status OUTPUT_FULL and tries it again next
+time it's run, so nothing is lost. The scheduler, traces and profiles treat
+that like NEEDS_INPUT: the OUTPUT doesn't count as executed, and the machine
+is set aside until it can go again.
+"""
+from array import array
+import os
+import queue
+import sys
+import tempfile
+import threading
+import unittest
+
+import intcode
+from intcode import Intcode
+
+
+class Callback:
+    """
+    call function with every output
+    """
+
+    def __init__(self, function):
+        self.append = function
+
+
+class Bounded:
+    """
+    a queue of at most size outputs
+
+    when it's full, append either waits for a consumer in another thread to
+    make room (block=True, giving up with OutputFull after timeout seconds if
+    there is one), or straight away suspends the machine with OUTPUT_FULL
+    """
+
+    def __init__(self, size, block=False, timeout=None):
+        self.queue = queue.Queue(size)
+        self.block = block
+        self.timeout = timeout
+
+    def append(self, value):
+        try:
+            self.queue.put(value, self.block, self.timeout)
+        except queue.Full:
+            raise intcode.OutputFull from None
+
+    def get(self, block=True, timeout=None):
+        return self.queue.get(block, timeout)
+
+    def drain(self):
+        """
+        every output waiting, oldest first
+        """
+        values = []
+        while True:
+            try:
+                values.append(self.queue.get_nowait())
+            except queue.Empty:
+                return values
+
+    def __len__(self):
+        return self.queue.qsize()
+
+
+class File:
+    """
+    write outputs to a binary file as little endian 64 bit ints, buffering
+    size of them at a time. read() reads them back
+
+    file is a path, or a file opened for binary writing that the caller
+    closes. values that don't fit in 64 bits are a ValueError
+    """
+
+    def __init__(self, file, size=4096):
+        self.owned = isinstance(file, (str, os.PathLike))
+        self.file = open(file, "wb") if self.owned else file
+        self.size = size
+        self.buffer = array("q")
+        self.written = 0
+
+    def append(self, value):
+        try:
+            self.buffer.append(value)
+        except OverflowError:
+            raise ValueError("file sinks only hold 64 bit values")
+        if len(self.buffer) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder == "big":
+            self.buffer.byteswap()
+        self.file.write(self.buffer.tobytes())
+        self.written += len(self.buffer)
+        self.buffer = array("q")
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.owned:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.written + len(self.buffer)
+
+
+def read(path):
+    """
+    the outputs a File sink wrote to path
+    """
+    values = array("q")
+    with open(path, "rb") as f:
+        values.frombytes(f.read())
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+
+class Count:
+    """
+    just count the outputs, for benchmarks
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def append(self, value):
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+
+class Test(unittest.TestCase):
+    # count down from 3, outputting each number
+    COUNTDOWN = "1101,0,3,14,4,14,1001,14,-1,14,1005,14,4,99,0"
+
+    def test_default_list(self):
+        machine = Intcode(self.COUNTDOWN)
+        machine.run()
+        self.assertEqual([3, 2, 1], machine.output)
+        machine.reset()
+        self.assertEqual([], machine.output)
+
+    def test_callback(self):
+        seen = []
+        machine = Intcode(self.COUNTDOWN, output=Callback(seen.append))
+        machine.run_fast()
+        self.assertEqual([3, 2, 1], seen)
+
+    def test_count(self):
+        sink = Count()
+        Intcode(self.COUNTDOWN, output=sink).run()
+        self.assertEqual(3, len(sink))
+
+    def test_bounded_suspends(self):
+        sink = Bounded(2)
+        machine = Intcode(self.COUNTDOWN, output=sink)
+        self.assertEqual(Intcode.OUTPUT_FULL, machine.run())
+        self.assertEqual(4, machine.ip)
+        self.assertEqual([3, 2], sink.drain())
+
+        self.assertEqual(Intcode.HALTED, machine.run_fast())
+        self.assertEqual([1], sink.drain())
+
+    def test_bounded_blocks(self):
+        sink = Bounded(1, block=True)
+        machine = Intcode(self.COUNTDOWN, output=sink)
+        thread = threading.Thread(target=machine.run)
+        thread.start()
+        values = [sink.get(timeout=5) for _ in range(3)]
+        thread.join(5)
+        self.assertEqual([3, 2, 1], values)
+        self.assertEqual(Intcode.HALTED, machine.status)
+
+    def test_bounded_timeout(self):
+        sink = Bounded(1, block=True, timeout=0.01)
+        machine = Intcode(self.COUNTDOWN, output=sink)
+        self.assertEqual(Intcode.OUTPUT_FULL, machine.run())
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "outputs.bin")
+            with File(path, size=2) as sink:
+                Intcode(self.COUNTDOWN, output=sink).run()
+                self.assertEqual(2, sink.written)
+                self.assertEqual(3, len(sink))
+            self.assertEqual([3, 2, 1], read(path))
+
+    def test_file_too_big(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with File(os.path.join(directory, "outputs.bin")) as sink:
+                with self.assertRaises(ValueError):
+                    Intcode("104,9223372036854775808,99", output=sink).run()
+
+    def test_outputs(self):
+        sink = Bounded(10)
+        machine = Intcode(self.COUNTDOWN, output=sink)
+        self.assertEqual([3, 2, 1], list(machine.outputs()))
+        self.assertIs(sink, machine.output)
+        self.assertEqual([3, 2, 1], sink.drain())
+
+    def test_outputs_full(self):
+        sink = Bounded(1)
+        machine = Intcode(self.COUNTDOWN, output=sink)
+        self.assertEqual([3], list(machine.outputs()))
+        self.assertEqual(Intcode.OUTPUT_FULL, machine.status)
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    sink = Count()
+    Intcode(source, 1, output=sink).run()
+    print(len(sink))
@@ -0,0 +1,327 @@
+"""
+Save an Intcode machine's whole state to a file, and load it back
+
+The file is a fixed size header and the name of the machine's opcode set,
+followed by little endian 64 bit ints: the program image the machine started
+from, memory, then any pending input, then the outputs produced so far. Paged
+memory is saved page by page, each page prefixed with its number, so a sparse
+machine stays small on disk. Keeping the image means a restored machine's
+reset() and fork() go back to the start of the program, like the original's.
+
+load() memory-maps the file and builds the image and memory straight out of
+the mapping, each copied just once, so restoring a warmed up machine in lots
+of processes is about as cheap as it gets without re-running the program to
+get there.
+
+A machine reading from an iterator can't be saved, there's no way to save
+what the iterator would have produced next. Neither can one with an output
+sink other than a list, since its outputs can't be read back.
+"""
+from array import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import intcode
+import intcode_memory
+import intcode_sinks
+from intcode import Intcode
+
+MAGIC = b"INTCODE\x02"
+
+# magic, ip, status, paged, has scalar input, scalar input, memory length,
+# page size, page count, pending input count, output count, image length,
+# opcode set version, opcode set name length
+HEADER = struct.Struct("<8sqBBBqqqqqqqqq")
+
+STATUSES = (Intcode.RUNNING, Intcode.NEEDS_INPUT, Intcode.HALTED,
+            Intcode.OUTPUT_FULL)
+
+CELL = array("q").itemsize
+
+
+def _pack(values):
+    try:
+        packed = array("q", values)
+    except OverflowError:
+        raise ValueError("snapshots only hold 64 bit values")
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(view, offset, count):
+    """
+    the count cells at offset in view, and the offset after them. on a little
+    endian machine that's a view of the file itself, which the caller copies
+    out of before it's closed
+    """
+    end = offset + count * CELL
+    if sys.byteorder == "little":
+        return view[offset:end].cast("q"), end
+    cells = array("q")
+    cells.frombytes(view[offset:end])
+    cells.byteswap()
+    return cells, end
+
+
+def save(machine, path):
+    """
+    write machine's state to path, atomically replacing whatever's there
+    """
+    if machine.source is not None:
+        raise ValueError(
+            "can't snapshot a machine reading from an iterator or queue")
+    if not isinstance(machine.output, list):
+        raise ValueError("can't snapshot a machine with an output sink")
+
+    image = machine.image
+    if isinstance(image, (str, bytes, bytearray, mmap.mmap)):
+        # a backend that parses as it goes was handed the source
+        image = intcode.parse(image)
+    body = [_pack(image)]
+
+    memory = machine.memory
+    paged = isinstance(memory, intcode_memory.Paged)
+    if paged:
+        body.extend(_pack([number] + page)
+                    for number, page in sorted(memory.pages.items()))
+        page_size, page_count = memory.PAGE_SIZE, len(memory.pages)
+    else:
+        body.append(_pack(memory))
+        page_size, page_count = 0, 0
+
+    body.append(_pack(machine.pending))
+    body.append(_pack(machine.output))
+    opcodes = machine.OPCODES
+    name = opcodes.name.encode()
+    header = HEADER.pack(
+        MAGIC, machine.ip, STATUSES.index(machine.status), paged,
+        machine.input is not None, machine.input or 0, len(memory),
+        page_size, page_count, len(machine.pending), len(machine.output),
+        len(image), opcodes.version, len(name))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+        f.write(header)
+        f.write(name)
+        for chunk in body:
+            f.write(chunk)
+    os.replace(f.name, path)
+
+
+def load(path, memory=list):
+    """
+    a new machine in the state saved at path, running the opcode set it was
+    saved with, which has to be registered
+
+    memory is the backend to restore into, unless the machine was saved with
+    paged memory, in which case it comes back paged
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return _load(view, memory)
+
+
+def _load(view, memory):
+    (magic, ip, status, paged, has_input, scalar_input, length, page_size,
+     page_count, pending_count, output_count, image_length, version,
+     name_length) = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("not an Intcode snapshot")
+    offset = HEADER.size + name_length
+    name = bytes(view[HEADER.size:offset]).decode()
+    opcodes = intcode.OPCODE_SETS.get(name)
+    if opcodes is None:
+        raise ValueError(f"opcode set {name!r} isn't registered")
+    if opcodes.version != version:
+        raise ValueError(f"snapshot is from version {version} of {name!r}, "
+                         f"not {opcodes.version}")
+
+    # the image outlives the mapping, so it gets its own copy
+    cells, offset = _unpack(view, offset, image_length)
+    image = intcode.image(intcode_memory.typed(cells))
+
+    if paged:
+        memory = intcode_memory.Paged
+        restored = intcode_memory.Paged()
+        for _ in range(page_count):
+            page, offset = _unpack(view, offset, page_size + 1)
+            restored.pages[page[0]] = page[1:].tolist()
+        restored.length = length
+    else:
+        cells, offset = _unpack(view, offset, length)
+        restored = memory(cells)
+
+    # hand the restored memory straight over, rather than having reset()
+    # copy the image into memory only for it to be replaced
+    machine = Intcode(image, memory=lambda image: restored)
+    machine.backend = memory
+    machine.OPCODES = opcodes
+
+    pending, offset = _unpack(view, offset, pending_count)
+    output, offset = _unpack(view, offset, output_count)
+    machine.ip = ip
+    machine.status = STATUSES[status]
+    machine.input = scalar_input if has_input else None
+    machine.feed(*pending.tolist())
+    machine.output = output.tolist()
+    return machine
+
+
+class Test(unittest.TestCase):
+    # add up inputs until one is 0, then output the total
+    TOTAL = "3,15,1006,15,12,1,15,16,16,1105,1,0,4,16,99,0,0"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "machine.bin")
+
+    def test_round_trip(self):
+        machine = Intcode(self.TOTAL)
+        machine.feed(1, 2)
+        machine.run()
+        machine.feed(3)
+        save(machine, self.path)
+
+        restored = load(self.path)
+        self.assertEqual(machine.memory, restored.memory)
+        self.assertEqual(machine.ip, restored.ip)
+        self.assertEqual(Intcode.NEEDS_INPUT, restored.status)
+        self.assertEqual([3], list(restored.pending))
+
+        restored.feed(0)
+        restored.run()
+        self.assertEqual([6], restored.output)
+
+    def test_scalar_input_and_output(self):
+        machine = Intcode("3,0,4,0,99", 42)
+        machine.run()
+        save(machine, self.path)
+
+        restored = load(self.path, memory=intcode_memory.typed)
+        self.assertEqual(42, restored.input)
+        self.assertEqual([42], restored.output)
+        self.assertEqual(Intcode.HALTED, restored.status)
+        self.assertIsInstance(restored.memory, array)
+
+    def test_clones_are_independent(self):
+        machine = Intcode(self.TOTAL, [5])
+        machine.run()
+        save(machine, self.path)
+
+        first, second = load(self.path), load(self.path)
+        first.feed(1, 0)
+        second.feed(2, 0)
+        first.run()
+        second.run()
+        self.assertEqual([6], first.output)
+        self.assertEqual([7], second.output)
+
+    def test_paged(self):
+        machine = Intcode("1101,1,2,1000000,99", memory=intcode_memory.Paged)
+        machine.run()
+        save(machine, self.path)
+        self.assertLess(os.path.getsize(self.path), 3 * 1024 * CELL)
+
+        restored = load(self.path)
+        self.assertIsInstance(restored.memory, intcode_memory.Paged)
+        self.assertEqual(3, restored.memory[1000000])
+        self.assertEqual(1000001, len(restored.memory))
+
+    def test_memory_built_once(self):
+        machine = Intcode(self.TOTAL, [4, 5])
+        machine.run()
+        save(machine, self.path)
+
+        built = []
+        restored = load(self.path, memory=lambda cells: built.append(
+            list(cells)) or built[-1])
+        self.assertEqual([machine.memory], built)
+        self.assertEqual(Intcode(self.TOTAL).memory, list(restored.image))
+
+    def test_big_endian(self):
+        with mock.patch.object(sys, "byteorder", "big"):
+            for memory in (list, intcode_memory.typed, intcode_memory.Paged):
+                machine = Intcode(self.TOTAL, [-4, 6], memory=memory)
+                machine.run()
+                save(machine, self.path)
+                restored = load(self.path, memory=memory)
+                self.assertEqual(list(machine.memory),
+                                 list(restored.memory))
+                self.assertEqual(Intcode(self.TOTAL).memory,
+                                 list(restored.image))
+                restored.feed(0)
+                restored.run()
+                self.assertEqual([2], restored.output)
+
+    def test_iterator_input(self):
+        machine = Intcode("3,0,99", iter([1]))
+        with self.assertRaises(ValueError):
+            save(machine, self.path)
+
+    def test_reset_after_restore(self):
+        for memory in (list, intcode_memory.typed, intcode_memory.Paged):
+            machine = Intcode(self.TOTAL, [4], memory=memory)
+            machine.run()
+            save(machine, self.path)
+
+            restored = load(self.path, memory=memory)
+            fork = restored.fork()
+            restored.reset()
+            for machine in (restored, fork):
+                self.assertEqual(Intcode(self.TOTAL).memory,
+                                 list(machine.memory))
+                # the 4 was read before the snapshot
+                machine.feed(2, 0)
+                machine.run()
+                self.assertEqual([2], machine.output)
+            self.assertIsInstance(fork.memory, type(memory([1])))
+
+    def test_opcode_set(self):
+        class Day2(intcode.Intcode):
+            OPCODES = intcode.DAY_2
+
+        machine = Day2("1,0,0,0,99")
+        save(machine, self.path)
+        restored = load(self.path)
+        self.assertIs(intcode.DAY_2, restored.OPCODES)
+        restored.run()
+        self.assertEqual(2, restored.memory[0])
+
+        unknown = Day2("1,0,0,0,99")
+        unknown.OPCODES = intcode.OpcodeSet("unknown", 1, {})
+        save(unknown, self.path)
+        with self.assertRaises(ValueError):
+            load(self.path)
+
+    def test_output_sink(self):
+        machine = Intcode("104,1,99", output=intcode_sinks.Count())
+        machine.run()
+        with self.assertRaises(ValueError):
+            save(machine, self.path)
+
+    def test_too_big(self):
+        machine = Intcode("1102,4611686018427387904,4,0,99")
+        machine.run()
+        with self.assertRaises(ValueError):
+            save(machine, self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    machine = Intcode(source, 5)
+    machine.run()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "day05.snapshot")
+        save(machine, path)
+        print(os.path.getsize(path), load(path).output)
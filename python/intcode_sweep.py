@@ -0,0 +1,186 @@
+"""
+Sweep an Intcode program over lots of parameters in a pool of processes
+
+A parameter is a Point: memory patches to apply (like day 2's noun and verb)
+and input to feed. Every worker process parses the program once, when it
+starts, and after that each point only costs a reset(), the patches and a
+run. The predicate is called in the worker with the finished machine, and
+only the points it returns something truthy for come back.
+
+Points are sent out in chunks, a couple per worker at a time, so a huge
+space is never all in memory at once. Results are yielded as chunks finish,
+which isn't necessarily the order of the space. Stopping early (like find()
+does) cancels every chunk that hasn't started yet.
+
+The predicate and machine class go to the workers by pickling, so they need
+to be defined at the top level of a module. Points whose program raises
+anything (an invalid instruction, an address outside memory) are skipped, and
+so are points still running after max_steps instructions, so one that never
+halts can't hang its worker.
+"""
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import functools
+import itertools
+import os
+import unittest
+
+import day_02_2
+from intcode import Intcode
+
+Point = namedtuple("Point", "patches inputs", defaults=((), ()))
+
+# the machine each worker resets for every point
+_machine = None
+
+
+def _warm(source, machine_class):
+    global _machine
+    _machine = machine_class(source)
+
+
+def _run_chunk(points, predicate, max_steps):
+    machine = _machine
+    found = []
+    for point in points:
+        machine.reset()
+        machine.pending.clear()
+        try:
+            for address, value in point.patches:
+                machine.memory[address] = value
+            machine.feed(*point.inputs)
+            if machine.run(max_steps=max_steps) == machine.RUNNING:
+                continue
+        except Exception:
+            continue
+        value = predicate(machine)
+        if value:
+            found.append((point, value))
+    return found
+
+
+def sweep(source, space, predicate, machine=Intcode, workers=None,
+          chunk_size=100, max_steps=1000000):
+    """
+    yield (point, predicate's value) for every point in space that predicate
+    is truthy for, as they're found. max_steps=None lets every point run for
+    as long as it takes
+    """
+    workers = workers or os.cpu_count() or 1
+    points = iter(space)
+    with ProcessPoolExecutor(workers, initializer=_warm,
+                             initargs=(source, machine)) as executor:
+        running = set()
+        try:
+            while True:
+                while len(running) < workers * 2:
+                    chunk = list(itertools.islice(points, chunk_size))
+                    if not chunk:
+                        break
+                    running.add(executor.submit(
+                        _run_chunk, chunk, predicate, max_steps))
+                if not running:
+                    return
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        finally:
+            for future in running:
+                future.cancel()
+
+
+def find(source, space, predicate, **kwargs):
+    """
+    the first (point, value) sweep finds, or None. which one that is depends
+    on which chunk finishes first
+    """
+    results = sweep(source, space, predicate, **kwargs)
+    try:
+        return next(results, None)
+    finally:
+        results.close()
+
+
+def memory_is(address, value, machine):
+    return machine.memory[address] == value
+
+
+def first_output(machine):
+    return machine.output[:1]
+
+
+def nouns_and_verbs(limit=100):
+    """
+    day 2's space, memory[1] and memory[2] both in range(limit)
+    """
+    for noun in range(limit):
+        for verb in range(limit):
+            yield Point(((1, noun), (2, verb)))
+
+
+class Test(unittest.TestCase):
+    # memory[0] ends up noun * verb * 2
+    PRODUCT = "1,0,0,3,2,1,2,0,2,0,13,0,99,2" + ",0" * 90
+
+    def test_sweep(self):
+        found = sweep(self.PRODUCT, nouns_and_verbs(10),
+                      functools.partial(memory_is, 0, 36),
+                      machine=day_02_2.Intcode, workers=2, chunk_size=7)
+        self.assertEqual(
+            {(2, 9), (3, 6), (6, 3), (9, 2)},
+            {(point.patches[0][1], point.patches[1][1])
+             for point, _ in found})
+
+    def test_find(self):
+        point, value = find(self.PRODUCT, nouns_and_verbs(),
+                            functools.partial(memory_is, 0, 84),
+                            machine=day_02_2.Intcode, workers=2)
+        (_, noun), (_, verb) = point.patches
+        self.assertEqual(42, noun * verb)
+        self.assertIs(True, value)
+
+    def test_not_found(self):
+        self.assertIsNone(find(self.PRODUCT, nouns_and_verbs(5),
+                               functools.partial(memory_is, 0, 1),
+                               machine=day_02_2.Intcode, workers=2))
+
+    def test_inputs(self):
+        # output 1 if the input equals 8, 0 otherwise
+        source = "3,9,8,9,10,9,4,9,99,-1,8"
+        found = dict(sweep(source, (Point(inputs=(i,)) for i in range(20)),
+                           first_output, workers=2, chunk_size=3))
+        self.assertEqual({Point(inputs=(8,)): [1]},
+                         {point: value for point, value in found.items()
+                          if value == [1]})
+        self.assertEqual(20, len(found))
+
+    def test_invalid_skipped(self):
+        # the input is run as an instruction after outputting 7
+        source = "3,4,104,7,0"
+        found = dict(sweep(source, (Point(inputs=(i,)) for i in (99, 98)),
+                           first_output, workers=1))
+        self.assertEqual({Point(inputs=(99,)): [7]}, found)
+
+        # outputs what's at the address the input says
+        points = (Point(inputs=(i,)) for i in (0, 1000, -1000))
+        found = dict(sweep("3,3,4,0,99", points, first_output, workers=1))
+        self.assertEqual({Point(inputs=(0,)): [3]}, found)
+
+    def test_runaway_skipped(self):
+        # output 1, then loop forever if the input is 0
+        source = "3,9,104,1,1006,9,4,99,0,0"
+        points = (Point(inputs=(i,)) for i in (0, 1))
+        found = dict(sweep(source, points, first_output, workers=1,
+                           max_steps=1000))
+        self.assertEqual({Point(inputs=(1,)): [1]}, found)
+
+
+if __name__ == "__main__":
+    with open("inputs/day02.txt") as f:
+        source = f.read()
+
+    point, _ = find(source, nouns_and_verbs(),
+                    functools.partial(memory_is, 0, 19690720),
+                    machine=day_02_2.Intcode)
+    (_, noun), (_, verb) = point.patches
+    print(f"found {noun * 100 + verb}: {noun=} {verb=}")
@@ -0,0 +1,221 @@
+"""
+Keep the last few instructions an Intcode machine executed, and rewind to them
+
+Trace.run drives a machine through step() and records each instruction in a
+ring buffer of a fixed size: the ip, the decoded instruction and modes, and
+the store it made (address, old value, new value). Memory use doesn't change
+however long the program runs.
+
+Because every entry knows what it overwrote, a machine can be rewound to any
+step still in the buffer without starting again from the beginning. Values
+read by INPUT go back on the front of its pending input and OUTPUTs are taken
+back off, so running forward again replays exactly the same steps. An output
+sink other than a list can't take outputs back, so with one of those a
+machine can only be rewound to after its last OUTPUT.
+"""
+import unittest
+
+import intcode_sinks
+from intcode import Intcode
+
+
+class Trace:
+    def __init__(self, size):
+        self.size = size
+        # instructions executed so far, entry i is in slot i % size
+        self.steps = 0
+        self.ips = [0] * size
+        self.instructions = [0] * size
+        self.modes = [None] * size
+        # address stored to, or None
+        self.addresses = [None] * size
+        self.old = [0] * size
+        self.new = [0] * size
+
+    def run(self, machine, until=None):
+        """
+        same as machine.run(), recording every instruction, but stopping
+        once steps reaches until
+        """
+        memory = machine.memory
+        machine.status = machine.RUNNING
+        while until is None or self.steps < until:
+            ip = machine.ip
+            instruction, modes = machine.decode(memory[ip])
+            address = machine.write_target(ip)
+            if address is not None:
+                old = memory[address]
+
+            result = machine.step()
+            if machine.status in (machine.NEEDS_INPUT, machine.OUTPUT_FULL):
+                # nothing was executed, it's tried again next run
+                break
+            memory = machine.memory
+
+            slot = self.steps % self.size
+            self.ips[slot] = ip
+            self.instructions[slot] = instruction
+            self.modes[slot] = modes
+            self.addresses[slot] = address
+            if address is not None:
+                self.old[slot] = old
+                self.new[slot] = memory[address]
+            self.steps += 1
+
+            if result is None:
+                break
+            machine.ip = result
+        return machine.status
+
+    def entries(self):
+        """
+        (step, ip, instruction, modes, (address, old, new) or None) for
+        everything still in the buffer, oldest first
+        """
+        for step in range(max(0, self.steps - self.size), self.steps):
+            slot = step % self.size
+            store = None
+            if self.addresses[slot] is not None:
+                store = (self.addresses[slot], self.old[slot], self.new[slot])
+            yield (step, self.ips[slot], self.instructions[slot],
+                   self.modes[slot], store)
+
+    def rewind(self, machine, step):
+        """
+        put machine back how it was just before step was executed
+        """
+        if not max(0, self.steps - self.size) <= step <= self.steps:
+            raise ValueError(
+                f"step {step} isn't in the trace, "
+                f"which has {max(0, self.steps - self.size)} to {self.steps}")
+        if not isinstance(machine.output, list) and any(
+                self.instructions[s % self.size] == Intcode.OUTPUT
+                for s in range(step, self.steps)):
+            raise ValueError("can't take outputs back out of a sink")
+
+        while self.steps > step:
+            self.steps -= 1
+            slot = self.steps % self.size
+            address = self.addresses[slot]
+            if address is not None:
+                machine.memory[address] = self.old[slot]
+            if self.instructions[slot] == Intcode.INPUT:
+                machine.pending.appendleft(self.new[slot])
+            elif self.instructions[slot] == Intcode.OUTPUT:
+                machine.output.pop()
+            machine.ip = self.ips[slot]
+        machine.status = machine.RUNNING
+
+    def seek(self, machine, step):
+        """
+        rewind or run machine so that it's about to execute step
+        """
+        if step < self.steps:
+            self.rewind(machine, step)
+        else:
+            self.run(machine, until=step)
+
+
+class Test(unittest.TestCase):
+    # read a number, then count down from it, outputting each number
+    COUNTDOWN = "3,15,4,15,1001,15,-1,15,1005,15,2,99,0,0,0,0"
+
+    def stepped(self, source, inputs, steps):
+        machine = Intcode(source, inputs)
+        for _ in range(steps):
+            machine.ip = machine.step()
+        return machine
+
+    def test_records(self):
+        machine = Intcode(self.COUNTDOWN, [3])
+        trace = Trace(4)
+        trace.run(machine)
+        self.assertEqual([3, 2, 1], machine.output)
+        self.assertEqual(11, trace.steps)
+        self.assertEqual([
+            (7, 2, Intcode.OUTPUT, [0, 0, 0], None),
+            (8, 4, Intcode.ADD, [0, 1, 0], (15, 1, 0)),
+            (9, 8, Intcode.JUMP_IF_TRUE, [0, 1, 0], None),
+            (10, 11, Intcode.HALT, [0, 0, 0], None),
+        ], list(trace.entries()))
+        self.assertEqual(4, len(trace.ips))
+
+    def test_rewind(self):
+        machine = Intcode(self.COUNTDOWN, [3])
+        trace = Trace(8)
+        trace.run(machine)
+
+        trace.rewind(machine, 5)
+        expected = self.stepped(self.COUNTDOWN, [3], 5)
+        self.assertEqual(expected.memory, machine.memory)
+        self.assertEqual(expected.ip, machine.ip)
+        self.assertEqual(expected.output, machine.output)
+
+    def test_rewind_input(self):
+        machine = Intcode(self.COUNTDOWN, [3])
+        trace = Trace(20)
+        trace.run(machine)
+        trace.rewind(machine, 0)
+        self.assertEqual(0, machine.ip)
+        self.assertEqual([], machine.output)
+        self.assertEqual([3], list(machine.pending))
+
+    def test_replay(self):
+        machine = Intcode(self.COUNTDOWN, [3])
+        trace = Trace(8)
+        trace.run(machine)
+        final = list(machine.memory)
+
+        trace.seek(machine, 4)
+        trace.seek(machine, 7)
+        expected = self.stepped(self.COUNTDOWN, [3], 7)
+        self.assertEqual(expected.memory, machine.memory)
+        self.assertEqual(expected.output, machine.output)
+
+        trace.run(machine)
+        self.assertEqual(final, machine.memory)
+        self.assertEqual([3, 2, 1], machine.output)
+
+    def test_output_full(self):
+        sink = intcode_sinks.Bounded(1)
+        machine = Intcode(self.COUNTDOWN, [3], output=sink)
+        trace = Trace(20)
+        self.assertEqual(Intcode.OUTPUT_FULL, trace.run(machine))
+        self.assertEqual(4, trace.steps)
+        self.assertEqual([3], sink.drain())
+        self.assertEqual(Intcode.OUTPUT_FULL, trace.run(machine))
+        self.assertEqual([2], sink.drain())
+        self.assertEqual(Intcode.HALTED, trace.run(machine))
+        self.assertEqual([1], sink.drain())
+        # every OUTPUT is recorded once, however many tries it took
+        self.assertEqual(11, trace.steps)
+        self.assertEqual(3, [entry[2] for entry in trace.entries()].count(
+            Intcode.OUTPUT))
+
+    def test_rewind_sink(self):
+        machine = Intcode(self.COUNTDOWN, [3], output=intcode_sinks.Count())
+        trace = Trace(20)
+        trace.run(machine)
+        trace.rewind(machine, 9)
+        with self.assertRaises(ValueError):
+            trace.rewind(machine, 2)
+        self.assertEqual(9, trace.steps)
+
+    def test_rewind_too_far(self):
+        machine = Intcode(self.COUNTDOWN, [3])
+        trace = Trace(4)
+        trace.run(machine)
+        with self.assertRaises(ValueError):
+            trace.rewind(machine, 6)
+
+
+if __name__ == "__main__":
+    with open("inputs/day05.txt") as f:
+        source = f.read()
+
+    machine = Intcode(source, 5)
+    trace = Trace(10)
+    trace.run(machine)
+
+    for entry in trace.entries():
+        print(*entry)